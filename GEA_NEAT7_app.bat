@@ -7,6 +7,6 @@ IF EXIST venv\Scripts\activate (
 REM Navega até a pasta do projeto
 cd SQL Dados
 
-REM Inicia o servidor Flask
+REM Inicia o servidor de produção (Waitress); para depuração use: python app.py
 start "" http://127.0.0.1:5000
-python app.py
+python serve.py --threads 8
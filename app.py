@@ -1,23 +1,43 @@
-# Versão: v91 (Otimizações de Performance e Usabilidade)
+# Versão: v105 (Correções da revisão)
 import os
 import io
 import zipfile
 import csv
 import json
-import shutil
+import math
 import logging
+import time
+import uuid
 import threading
+import importlib
 from functools import lru_cache
 from contextlib import contextmanager
-import pandas as pd
 import xml.etree.ElementTree as ET
 # v91: make_response foi adicionado para cookies
-from flask import Flask, render_template, request, redirect, url_for, flash, get_flashed_messages, session, make_response, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, get_flashed_messages, session, make_response, send_file, jsonify, g, has_request_context
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, UniqueConstraint, CheckConstraint
+from sqlalchemy import create_engine, event, select, Column, Integer, String, Text, ForeignKey, UniqueConstraint, CheckConstraint
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base, joinedload, selectinload
 from sqlalchemy.pool import StaticPool
-from googletrans import Translator
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateTable
+from project_bundle import BUNDLE_EXTENSION, write_bundle, read_bundle, load_bundle_tables
+from write_coordinator import ProjectWriter, WriterClosed, WRITE_RESULT_TIMEOUT
+from logging_pipeline import setup_logging
+from project_snapshot import backup_database, copy_database_into, create_snapshot, list_snapshots, extract_snapshot
+
+class _LazyModule:
+    """v99: Adia o import de módulos pesados (pandas ~0.3s) até ao primeiro uso"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+pd = _LazyModule('pandas')
 
 # --- Configuração ---
 basedir = os.path.abspath(os.path.dirname(__file__))
@@ -26,21 +46,89 @@ if not os.path.exists(DATABASE_FOLDER):
     os.makedirs(DATABASE_FOLDER)
 
 TEMPLATE_DB_NAME = 'Neat7_template_v68.db'
+# v92: Versão do schema gravada em PRAGMA user_version de cada projeto
+SCHEMA_VERSION = 92
+# v97: Detalhe de phase renderiza só a aba ativa no servidor; as outras vêm de data.json
+PHASE_DETAIL_LAZY_TABS = True
+PHASE_TABS = ['parametros', 'tab-passos', 'tab-transicoes', 'tab-interlocks']
+# v94: Linhas por executemany no UPSERT da mesclagem com atualização
+UPSERT_BATCH_SIZE = 500
+# v99: Ficheiros já verificados (mtime + tamanho + SCHEMA_VERSION) não repetem create_all/migração
+SCHEMA_CACHE_FILE = '.schema_cache.json'
+# v101: Segundos que a conexão do escritor espera por um lock de outro processo antes de SQLITE_BUSY
+SQLITE_BUSY_TIMEOUT = 30
+# v105: Conexões de leitura por projeto (uma por thread do pedido; WAL: leem durante as escritas)
+READ_POOL_SIZE = 8
+READ_POOL_OVERFLOW = 8
+# v105: Ficheiros aceites nos formulários do Master: planilha ou ZIP com <Folha>.csv (mesmas folhas)
+MASTER_UPLOAD_EXTENSIONS = ('.xlsx', '.zip')
+# v103: Relatórios da simulação (dry-run) guardados em DATABASE_FOLDER/.dryrun; só os mais recentes ficam
+DRY_RUN_FOLDER = '.dryrun'
+DRY_RUN_KEEP = 20
+# v104: Snapshots comprimidos em DATABASE_FOLDER/.snapshots/<projeto>; retenção por número e por idade
+SNAPSHOT_FOLDER = '.snapshots'
+SNAPSHOT_KEEP = 10
+SNAPSHOT_MAX_AGE_DAYS = 30
+# v105: Os automáticos ficam numa subpasta com retenção própria (as importações não apagam os manuais)
+SNAPSHOT_AUTO_FOLDER = 'auto'
+SNAPSHOT_AUTO_KEEP = 5
+# Snapshot automático antes de substituir o projeto (importação total, pacote, restauro; v105: na pausa do escritor)
+SNAPSHOT_BEFORE_REPLACE = True
+
+def get_template_path():
+    """v93: O template vive em DATABASE_FOLDER (por isso é excluído da lista); basedir mantido por compatibilidade"""
+    for folder in (DATABASE_FOLDER, basedir):
+        path = os.path.join(folder, TEMPLATE_DB_NAME)
+        if os.path.exists(path):
+            return path
+    return None
+
+# v91: Configuração de Logging; v102: fila + thread de escrita, JSON por linha, rotação comprimida
+LOG_FILE = 'neat_gestor.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_MAX_AGE_SECONDS = 7 * 24 * 3600
+LOG_BACKUP_COUNT = 10
+# Fração das linhas de alto volume mantida (1 em cada 1/taxa); avisos, erros e pedidos lentos passam sempre
+LOG_SAMPLE_RATES = {'dashboard': 0.1}
+LOG_SLOW_REQUEST_MS = 1000
+
+def _log_context():
+    """Contexto do pedido atual para cada linha de log (vazio fora de pedidos)"""
+    if not has_request_context():
+        return None
+    return {
+        'request_id': g.get('request_id'),
+        'project': (request.view_args or {}).get('project_name'),
+        'route': request.url_rule.rule if request.url_rule else request.path,
+        'method': request.method,
+    }
 
-# v91: Configuração de Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('neat_gestor.log'),
-        logging.StreamHandler()
-    ]
-)
+setup_logging(LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, max_age_seconds=LOG_MAX_AGE_SECONDS,
+              sample_rates=LOG_SAMPLE_RATES, context_fn=_log_context)
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger('neat.access')
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'uma-chave-secreta-muito-forte-v90'
 
+# v102: Cada pedido recebe um id e termina numa linha de acesso estruturada (duração, estado, linhas)
+@app.before_request
+def _start_request_log():
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12]
+    g.started = time.perf_counter()
+
+@app.after_request
+def _finish_request_log(response):
+    duration_ms = round((time.perf_counter() - g.get('started', time.perf_counter())) * 1000, 1)
+    slow = duration_ms >= LOG_SLOW_REQUEST_MS
+    extra = {'status': response.status_code, 'duration_ms': duration_ms, 'rows': g.get('log_rows')}
+    if request.endpoint == 'index' and request.method == 'GET':
+        extra['sample_key'] = 'dashboard'
+    level = logging.WARNING if slow or response.status_code >= 500 else logging.INFO
+    access_logger.log(level, f"{request.method} {request.path} {response.status_code} {duration_ms} ms", extra=extra)
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    return response
+
 # v91: Singleton do Translator com thread-safety
 _translator = None
 _translator_lock = threading.Lock()
@@ -51,6 +139,7 @@ def get_translator():
     if _translator is None:
         with _translator_lock:
             if _translator is None:
+                from googletrans import Translator  # v99: import tardio (só quem traduz paga o custo)
                 _translator = Translator()
                 logger.info("Translator instanciado")
     return _translator
@@ -63,16 +152,16 @@ class Areas(Base):
     area_id = Column(Integer, primary_key=True)
     nome_area = Column(String, nullable=False, unique=True)
     descricao = Column(String)
-    unidades = relationship('Unidades', back_populates='area', cascade="all, delete-orphan", lazy='joined')
+    unidades = relationship('Unidades', back_populates='area', cascade="all, delete-orphan", passive_deletes=True, lazy='joined')
 
 class Unidades(Base):
     __tablename__ = 'unidades'
     unidade_id = Column(Integer, primary_key=True)
     nome_unidade = Column(String, nullable=False, unique=True)
     descricao = Column(String)
-    area_id = Column(Integer, ForeignKey('areas.area_id'), nullable=False)
+    area_id = Column(Integer, ForeignKey('areas.area_id', ondelete='CASCADE'), nullable=False)
     area = relationship('Areas', back_populates='unidades', lazy='joined')
-    phases = relationship('Phases', back_populates='unidade', cascade="all, delete-orphan", lazy='dynamic')
+    phases = relationship('Phases', back_populates='unidade', cascade="all, delete-orphan", passive_deletes=True, lazy='dynamic')
 
 class Phases(Base):
     __tablename__ = 'phases'
@@ -82,19 +171,20 @@ class Phases(Base):
     descricao_pt = Column(String)
     descricao_en = Column(String)
     descricao_es = Column(String)
-    unidade_id = Column(Integer, ForeignKey('unidades.unidade_id'), nullable=False)
+    unidade_id = Column(Integer, ForeignKey('unidades.unidade_id', ondelete='CASCADE'), nullable=False)
     unidade = relationship('Unidades', back_populates='phases', lazy='joined')
-    parametros = relationship('Parametros', backref='phase', lazy='joined', cascade="all, delete-orphan")
-    passos = relationship('Passos', backref='phase', lazy='joined', cascade="all, delete-orphan")
-    transition_conditions = relationship('TransitionConditions', backref='phase', lazy='joined', cascade="all, delete-orphan")
-    transition_row_descriptions = relationship('TransitionRowDescriptions', backref='phase', lazy='joined', cascade="all, delete-orphan")
-    interlocks = relationship('Interlocks', backref='phase', lazy='joined', cascade="all, delete-orphan")
+    # v94: lazy='select' (joined em 5 coleções gerava produto cartesiano em cada query de Phases); usar selectinload onde necessário
+    parametros = relationship('Parametros', backref='phase', lazy='select', cascade="all, delete-orphan", passive_deletes=True)
+    passos = relationship('Passos', backref='phase', lazy='select', cascade="all, delete-orphan", passive_deletes=True)
+    transition_conditions = relationship('TransitionConditions', backref='phase', lazy='select', cascade="all, delete-orphan", passive_deletes=True)
+    transition_row_descriptions = relationship('TransitionRowDescriptions', backref='phase', lazy='select', cascade="all, delete-orphan", passive_deletes=True)
+    interlocks = relationship('Interlocks', backref='phase', lazy='select', cascade="all, delete-orphan", passive_deletes=True)
     __table_args__ = (UniqueConstraint('unidade_id', 'nome_phase'),)
 
 class Parametros(Base):
     __tablename__ = 'parametros'
     param_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     numero_param = Column(Integer, nullable=False)
     nome_param = Column(String, nullable=False)
     classe_param = Column(String, nullable=False)
@@ -111,7 +201,7 @@ class Parametros(Base):
 class Passos(Base):
     __tablename__ = 'passos'
     passo_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     numero_passo = Column(Integer, nullable=False)
     codigo_passo = Column(String)
     descricao_pt = Column(String)
@@ -122,7 +212,7 @@ class Passos(Base):
 class TransitionConditions(Base):
     __tablename__ = 'TransitionConditions'
     condition_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     step_index = Column(Integer, nullable=False)
     condition_row = Column(Integer, nullable=False)
     condition_logic = Column(String)
@@ -134,7 +224,7 @@ class TransitionConditions(Base):
 class TransitionRowDescriptions(Base):
     __tablename__ = 'TransitionRowDescriptions'
     row_desc_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     row_number = Column(Integer, nullable=False)
     descricao_pt = Column(String)
     descricao_en = Column(String)
@@ -144,7 +234,7 @@ class TransitionRowDescriptions(Base):
 class Interlocks(Base):
     __tablename__ = 'interlocks'
     interlock_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     numero_interlock = Column(Integer, nullable=False)
     seguranca_pt = Column(String)
     seguranca_en = Column(String)
@@ -155,32 +245,257 @@ class Interlocks(Base):
     __table_args__ = (UniqueConstraint('phase_id', 'numero_interlock'),)
 
 engines = {}
+_engine_file_ids = {}  # v105: identidade do ficheiro aberto por cada engine
+_engines_lock = threading.Lock()
+_schema_cache = None
+_schema_cache_lock = threading.Lock()
+
+def _schema_fingerprint(db_path):
+    st = os.stat(db_path)
+    return [st.st_mtime_ns, st.st_size, SCHEMA_VERSION]
+
+def _load_schema_cache():
+    global _schema_cache
+    if _schema_cache is None:
+        try:
+            with open(os.path.join(DATABASE_FOLDER, SCHEMA_CACHE_FILE), encoding='utf-8') as f:
+                _schema_cache = json.load(f)
+        except (OSError, ValueError):
+            _schema_cache = {}
+    return _schema_cache
+
+def _record_schema_checked(project_name, db_path):
+    """Regista a impressão digital do ficheiro já verificado (escrita atómica via os.replace)"""
+    with _schema_cache_lock:
+        cache = _load_schema_cache()
+        cache[project_name] = _schema_fingerprint(db_path)
+        cache_path = os.path.join(DATABASE_FOLDER, SCHEMA_CACHE_FILE)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Cache de schema não gravada: {e}")
+
+def _schema_is_current(engine):
+    """Verificação rápida: user_version atual e todas as tabelas presentes (uma query cada)"""
+    with engine.connect() as conn:
+        if conn.exec_driver_sql('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            return False
+        existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type='table'")}
+    return all(t.name in existing for t in Base.metadata.sorted_tables)
+
+def ensure_schema(project_name, engine, db_path):
+    """Cria tabelas/migra só quando o ficheiro mudou desde a última verificação (v99)"""
+    if _load_schema_cache().get(project_name) == _schema_fingerprint(db_path):
+        return
+    if not _schema_is_current(engine):
+        Base.metadata.create_all(engine)
+        migrate_schema(engine)
+        logger.info(f"Schema verificado/migrado para v{SCHEMA_VERSION}: {project_name}")
+    _record_schema_checked(project_name, db_path)
+
+def _sqlite_on_connect(dbapi_conn, conn_record):
+    """v92: SQLite só aplica ON DELETE CASCADE com foreign_keys ligado (por conexão)"""
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+def migrate_schema(engine):
+    """Migra ficheiros antigos para FKs com ON DELETE CASCADE (v92).
+
+    O SQLite não permite alterar FKs, por isso cada tabela sem CASCADE é
+    reconstruída (criar nova, copiar, apagar antiga, renomear) numa única
+    transação com foreign_keys desligado.
+    """
+    raw = engine.raw_connection()
+    try:
+        con = raw.driver_connection
+        if con.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        to_rebuild = []
+        for table in Base.metadata.sorted_tables:
+            fks = con.execute(f'PRAGMA foreign_key_list("{table.name}")').fetchall()
+            if any(fk[6].upper() != 'CASCADE' for fk in fks):  # fk[6] = on_delete
+                to_rebuild.append(table)
+        old_isolation = con.isolation_level
+        con.isolation_level = None
+        con.execute('PRAGMA foreign_keys=OFF')
+        try:
+            con.execute('BEGIN')
+            for table in to_rebuild:
+                tmp_name = f"_v{SCHEMA_VERSION}_{table.name}"
+                ddl = str(CreateTable(table).compile(dialect=engine.dialect)).strip()
+                ddl = ddl.replace(engine.dialect.identifier_preparer.format_table(table), f'"{tmp_name}"', 1)
+                existing_cols = {row[1] for row in con.execute(f'PRAGMA table_info("{table.name}")').fetchall()}
+                cols = ", ".join(f'"{c.name}"' for c in table.columns if c.name in existing_cols)
+                con.execute(ddl)
+                con.execute(f'INSERT INTO "{tmp_name}" ({cols}) SELECT {cols} FROM "{table.name}"')
+                con.execute(f'DROP TABLE "{table.name}"')
+                con.execute(f'ALTER TABLE "{tmp_name}" RENAME TO "{table.name}"')
+            orphans = con.execute('PRAGMA foreign_key_check').fetchall()
+            if orphans:
+                logger.warning(f"Migração v{SCHEMA_VERSION}: {len(orphans)} linhas órfãs encontradas (mantidas)")
+            con.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+            con.execute('COMMIT')
+        except Exception:
+            con.execute('ROLLBACK')
+            raise
+        finally:
+            con.execute('PRAGMA foreign_keys=ON')
+            con.isolation_level = old_isolation
+        if to_rebuild:
+            logger.info(f"Migração v{SCHEMA_VERSION}: tabelas reconstruídas com ON DELETE CASCADE: {[t.name for t in to_rebuild]}")
+    finally:
+        raw.close()
+
+def _file_id(project_name):
+    """(st_dev, st_ino) do ficheiro do projeto: muda quando outro processo apaga e recria o projeto (v105)"""
+    try:
+        st = os.stat(os.path.join(DATABASE_FOLDER, project_name))
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Base de dados {project_name} não encontrada.")
+    return (st.st_dev, st.st_ino)
 
 def get_engine(project_name):
-    """Retorna ou cria engine para o projeto especificado"""
+    """Retorna ou cria a engine de leitura do projeto especificado.
+
+    v105: Pool de conexões (cada pedido usa a sua, em vez de todos partilharem uma
+    StaticPool); com o ficheiro em WAL as leituras correm em paralelo com o escritor.
+    Se o ficheiro foi recriado (ex.: projeto apagado e criado de novo noutro worker),
+    a engine antiga ficaria presa ao inode apagado; é reaberta no ficheiro novo.
+    """
     db_path = os.path.join(DATABASE_FOLDER, project_name)
-    if not os.path.exists(db_path):
-        raise FileNotFoundError(f"Base de dados {project_name} não encontrada.")
-    if project_name not in engines:
-        engine = create_engine(
-            f'sqlite:///{db_path}',
-            poolclass=StaticPool,
-            connect_args={'check_same_thread': False},
-            echo=False  # v91: Desabilitar echo para melhor performance
-        )
-        Base.metadata.create_all(engine)
-        engines[project_name] = engine
-        logger.info(f"Engine criada para projeto: {project_name}")
+    file_id = _file_id(project_name)
+    if _engine_file_ids.get(project_name) != file_id:
+        with _engines_lock:  # v93: serializa com delete_project_db
+            if _engine_file_ids.get(project_name) != file_id:
+                engine = create_engine(
+                    f'sqlite:///{db_path}',
+                    pool_size=READ_POOL_SIZE,
+                    max_overflow=READ_POOL_OVERFLOW,
+                    connect_args={'check_same_thread': False},
+                    echo=False  # v91: Desabilitar echo para melhor performance
+                )
+                event.listen(engine, 'connect', _sqlite_on_connect)
+                ensure_schema(project_name, engine, db_path)
+                # A engine antiga não é fechada aqui (pode estar em uso); fecha-se quando deixar de ser referenciada
+                if project_name in engines:
+                    logger.info(f"Ficheiro de {project_name} recriado noutro processo: engine reaberta")
+                engines[project_name] = engine
+                _engine_file_ids[project_name] = file_id
+                logger.info(f"Engine criada para projeto: {project_name}")
     return engines[project_name]
 
+# --- ESCRITOR ÚNICO POR PROJETO (v101) ---
+_writers = {}
+_writer_file_ids = {}
+_writers_lock = threading.Lock()
+
+def _sqlite_writer_on_connect(dbapi_conn, conn_record):
+    """O SQLAlchemy passa a emitir o BEGIN (o pysqlite não o faz antes de SAVEPOINT)"""
+    _sqlite_on_connect(dbapi_conn, conn_record)
+    dbapi_conn.isolation_level = None
+    # v105: WAL (fica gravado no ficheiro): os leitores não esperam pelo COMMIT do escritor nem recebem SQLITE_BUSY
+    dbapi_conn.execute('PRAGMA journal_mode=WAL')
+
+def _sqlite_writer_on_begin(conn):
+    # IMMEDIATE reserva o lock logo no início: outro processo espera (busy timeout) em vez de falhar a meio
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+
+def create_writer_engine(project_name):
+    """Engine dedicada (uma conexão) da thread escritora; as leituras continuam em get_engine"""
+    get_engine(project_name)  # ficheiro existe e schema verificado
+    engine = create_engine(
+        f'sqlite:///{os.path.join(DATABASE_FOLDER, project_name)}',
+        poolclass=StaticPool,
+        connect_args={'check_same_thread': False, 'timeout': SQLITE_BUSY_TIMEOUT},
+        echo=False
+    )
+    event.listen(engine, 'connect', _sqlite_writer_on_connect)
+    event.listen(engine, 'begin', _sqlite_writer_on_begin)
+    return engine
+
+def get_writer(project_name):
+    """Escritor do projeto; v105: recriado se o ficheiro foi substituído desde que foi aberto"""
+    file_id = _file_id(project_name)
+    writer = _writers.get(project_name)
+    if writer is None or _writer_file_ids.get(project_name) != file_id:
+        with _writers_lock:
+            writer = _writers.get(project_name)
+            if writer is not None and _writer_file_ids.get(project_name) != file_id:
+                del _writers[project_name]
+                writer.close()
+                writer = None
+            if writer is None:
+                writer = _writers[project_name] = ProjectWriter(project_name, lambda: create_writer_engine(project_name))
+                _writer_file_ids[project_name] = file_id
+    return writer
+
+def run_write(project_name, fn, exclusive=False, timeout=WRITE_RESULT_TIMEOUT):
+    """Executa `fn(session)` no escritor do projeto e devolve o resultado já confirmado (COMMIT)"""
+    get_engine(project_name)  # FileNotFoundError no pedido, não na thread escritora
+    try:
+        return get_writer(project_name).run(fn, exclusive=exclusive, timeout=timeout)
+    except WriterClosed:
+        # v105: o escritor foi fechado por uma substituição do ficheiro entre get_writer e submit
+        return get_writer(project_name).run(fn, exclusive=exclusive, timeout=timeout)
+
+def close_writer(project_name):
+    """Esvazia a fila e fecha o escritor (antes de substituir ou apagar o ficheiro)"""
+    with _writers_lock:
+        writer = _writers.pop(project_name, None)
+        if writer is not None:
+            writer.close()
+
+def _reset_after_fork():
+    """v98: Conexões SQLite e o cliente HTTP do Translator não podem ser partilhados entre processos"""
+    global _translator, _translator_lock, _engines_lock, _schema_cache_lock, _writers_lock
+    for engine in engines.values():
+        engine.dispose(close=False)  # close=False: a conexão pertence ao processo pai
+    engines.clear()
+    _engine_file_ids.clear()
+    _engines_lock = threading.Lock()
+    _translator = None
+    _translator_lock = threading.Lock()
+    _schema_cache_lock = threading.Lock()
+    _writers.clear()  # v101: as threads escritoras não sobrevivem ao fork
+    _writer_file_ids.clear()
+    _writers_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def list_projects():
+    return sorted(f for f in os.listdir(DATABASE_FOLDER) if f.endswith('.db') and f != TEMPLATE_DB_NAME)
+
+def warm_up(projects=None):
+    """Pré-aquece engines (migração/schema), páginas SQLite e templates Jinja (v98)"""
+    projects = list_projects() if projects is None else projects
+    for project_name in projects:
+        try:
+            with get_engine(project_name).connect() as conn:
+                for table in Base.metadata.sorted_tables:
+                    conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{table.name}"').fetchone()
+        except Exception as e:
+            logger.warning(f"Warm-up falhou para {project_name}: {e}")
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+    logger.info(f"Warm-up concluído (pid {os.getpid()}): {len(projects)} projetos")
+
 @contextmanager
 def get_db_session(project_name):
-    """Context manager para sessões de DB (previne leaks de memória)"""
+    """Context manager para sessões de leitura (previne leaks de memória)
+
+    v105: Só leituras (as escritas vão por run_write): no fim faz ROLLBACK, que só
+    liberta a transação de leitura da conexão deste pedido.
+    """
     engine = get_engine(project_name)
     session = sessionmaker(bind=engine)()
     try:
         yield session
-        session.commit()
+        session.rollback()
     except Exception as e:
         session.rollback()
         logger.error(f"Erro na sessão DB para {project_name}: {e}")
@@ -285,38 +600,348 @@ def export_master_transitions(dbsession):
             trans_data_final.append(row_data_final)
     return pd.DataFrame(trans_data_final, columns=csv_header_final)
 
+# --- EXPORTAÇÕES ARCHESTRA/STEPS (v100: extraídas das rotas para uso também pelo CLI em lote) ---
+def _filter_phases(q, aid=None, uid=None, tipo=None):
+    """Filtros da página inicial (área/unidade por id, tipo de phase); a query já tem join com Unidades"""
+    if aid: q = q.filter(Unidades.area_id == int(aid))
+    if uid: q = q.filter(Phases.unidade_id == int(uid))
+    if tipo: q = q.filter(Phases.tipo_phase == tipo)
+    return q
+
+def _csv_bytes(output_buffer):
+    return output_buffer.getvalue().encode('utf-8')
+
+def export_master_xlsx(dbsession, aid=None, uid=None, tipo=None):
+    """Master Excel completo (os filtros não se aplicam). Retorna (bytes, nº de phases)"""
+    output_buffer = io.BytesIO()
+    with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
+        for sheet_name, export_fn in MASTER_EXPORT_SHEETS:
+            df = export_fn(dbsession); df.to_excel(writer, sheet_name=sheet_name, index=False)
+            if sheet_name == 'Phases': count = len(df)
+    return output_buffer.getvalue(), count
+
+def export_archestra_phases_csv(dbsession, aid=None, uid=None, tipo=None, steps_root=''):
+    q = dbsession.query(Phases).join(Unidades).join(Areas).order_by(Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase).options(joinedload(Phases.unidade).joinedload(Unidades.area))
+    phases = _filter_phases(q, aid, uid, tipo).all()
+    output_buffer = io.StringIO(); w = csv.writer(output_buffer); w.writerow([":TEMPLATE=$NRK100_Procedure"]); w.writerow([":Tagname","Area","SecurityGroup","ContainedName","ShortDesc","HMIText_StepInformation"])
+    root = (steps_root or '').replace(os.sep, '/')
+    for p_arch in phases:
+        an = p_arch.unidade.area.nome_area
+        w.writerow([f"{an}_{p_arch.nome_phase}", f"{an}_{p_arch.unidade.nome_unidade}", "Default", p_arch.nome_phase, p_arch.nome_phase, f"{root}/{p_arch.unidade.nome_unidade}/{an}_{p_arch.nome_phase}.xml"])
+    return _csv_bytes(output_buffer), len(phases)
+
+def export_steps_zip(dbsession, aid=None, uid=None, tipo=None):
+    q = dbsession.query(Phases).join(Unidades).options(joinedload(Phases.unidade).joinedload(Unidades.area), selectinload(Phases.passos))
+    phases = _filter_phases(q, aid, uid, tipo).all()
+    output_buffer = io.BytesIO()
+    with zipfile.ZipFile(output_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for pz in phases: zf.writestr(f"Steps/{pz.unidade.nome_unidade}/{pz.unidade.area.nome_area}_{pz.nome_phase}.xml", generate_steps_xml(pz))
+    return output_buffer.getvalue(), len(phases)
+
+def export_archestra_params_csv(dbsession, aid=None, uid=None, tipo=None):
+    q = dbsession.query(Parametros).join(Phases).join(Unidades).join(Areas).order_by(Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase, Parametros.numero_param).options(joinedload(Parametros.phase).joinedload(Phases.unidade).joinedload(Unidades.area))
+    params = _filter_phases(q, aid, uid, tipo).all()
+    output_buffer = io.StringIO(); w = csv.writer(output_buffer); curr = None
+    for pm_arch in params:
+        if pm_arch.tipo_dado != curr:
+            if curr: w.writerow([])
+            # v86: Correção de Cabeçalho
+            w.writerow([f":TEMPLATE=$NRK100_Parameter{'Float' if pm_arch.tipo_dado=='real' else 'Integer' if pm_arch.tipo_dado=='inteiro' else 'Bool'}_GEA"])
+            w.writerow([":Tagname","Area","SecurityGroup","Container","ContainedName","Description","ShortDesc","EngUnits","HMIText_ParamDescription.1046","HMIText_ParamDescription.1033","HMIText_ParamDescription.3082","AliasName","ExecutionRelativeOrder","ExecutionRelatedObject"]); curr = pm_arch.tipo_dado
+        d_pt = f"{pm_arch.nome_param}-{pm_arch.descricao_pt or ''}"; d_en = f"{pm_arch.nome_param}-{pm_arch.descricao_en or pm_arch.descricao_pt or ''}"; d_es = f"{pm_arch.nome_param}-{pm_arch.descricao_es or pm_arch.descricao_pt or ''}"
+        w.writerow([f"{pm_arch.phase.unidade.area.nome_area}_{pm_arch.phase.nome_phase}_{pm_arch.nome_param}", f"{pm_arch.phase.unidade.area.nome_area}_{pm_arch.phase.unidade.nome_unidade}", "Default", f"{pm_arch.phase.unidade.area.nome_area}_{pm_arch.phase.nome_phase}", pm_arch.nome_param, d_pt, d_pt, pm_arch.unidade_engenharia or "", d_pt, d_en, d_es, "None", "", ""])
+    return _csv_bytes(output_buffer), len(params)
+
+def export_archestra_interlocks_csv(dbsession, aid=None, uid=None, tipo=None):
+    q = dbsession.query(Phases).join(Unidades).join(Areas).order_by(Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase).options(joinedload(Phases.unidade).joinedload(Unidades.area), selectinload(Phases.interlocks))
+    phases = _filter_phases(q, aid, uid, tipo).all()
+    output_buffer = io.StringIO(); w = csv.writer(output_buffer)
+    # v86: Correção de Cabeçalho
+    w.writerow([":TEMPLATE=$NRK100_Procedure"]); w.writerow([":Tagname","Area","HMIText_SecureInterlocks.1046","HMIText_SecureInterlocks.1033","HMIText_SecureInterlocks.3082","HMIText_ProcessInterlocks.1046","HMIText_ProcessInterlocks.1033","HMIText_ProcessInterlocks.3082"])
+    for ph_il in phases:
+        il_map = {ilk.numero_interlock: ilk for ilk in ph_il.interlocks}; s_pt, s_en, s_es, p_pt, p_en, p_es = [],[],[],[],[],[]
+        for bit_i in range(32):
+            iobj = il_map.get(bit_i)
+            s_pt.append(iobj.seguranca_pt or "" if iobj else ""); s_en.append(iobj.seguranca_en or "" if iobj else ""); s_es.append(iobj.seguranca_es or "" if iobj else "")
+            p_pt.append(iobj.processo_pt or "" if iobj else ""); p_en.append(iobj.processo_en or "" if iobj else ""); p_es.append(iobj.processo_es or "" if iobj else "")
+        w.writerow([f"{ph_il.unidade.area.nome_area}_{ph_il.nome_phase}", f"{ph_il.unidade.area.nome_area}_{ph_il.unidade.nome_unidade}", ",".join(s_pt), ",".join(s_en), ",".join(s_es), ",".join(p_pt), ",".join(p_en), ",".join(p_es)])
+    return _csv_bytes(output_buffer), len(phases)
+
+# V88: Método SÍNCRONO (sem streaming) mas com 'selectinload'
+def export_archestra_transitions_csv(dbsession, aid=None, uid=None, tipo=None):
+    q = dbsession.query(Phases).join(Unidades).join(Areas).order_by(Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase).options(
+        joinedload(Phases.unidade).joinedload(Unidades.area),
+        selectinload(Phases.transition_conditions),
+        selectinload(Phases.transition_row_descriptions)
+    )
+    phases = _filter_phases(q, aid, uid, tipo).all() # Carrega tudo na memória (otimizado pelo selectinload)
+    output_buffer = io.StringIO(); w = csv.writer(output_buffer); w.writerow([":TEMPLATE=$NRK100_Procedure_Transitions_G"])
+
+    # V89: Loop explícito para cabeçalho
+    h = [":Tagname","Area","SecurityGroup","Container","ContainedName","Description","ShortDesc"]
+    for lc_code_h in ["1033","1046","3082"]:
+        for bit_idx_h in range(32): h.append(f"HMI_ConditionsDescription_{bit_idx_h:02d}.{lc_code_h}")
+    for lc_code_h in ["1033","1046","3082"]: h.append(f"HMI_TransitionDescription.{lc_code_h}")
+    w.writerow(h)
+
+    for p in phases:
+        row = [f"{p.unidade.area.nome_area}_{p.nome_phase}_Tran", f"{p.unidade.area.nome_area}_{p.unidade.nome_unidade}", "Default", f"{p.unidade.area.nome_area}_{p.nome_phase}", "TransitionConditions", "TransitionConditions", "TransitionConditions"]
+        # v100: guarda o objeto (não o texto já concatenado) para as três línguas abaixo
+        conds = {(c.step_index, c.condition_row): c for c in p.transition_conditions if c.condition_text_pt}
+        descs = {d.row_number: d for d in p.transition_row_descriptions}
+
+        # V89: Correção 'lang' -> 'l_code'
+        for l_code in ['en','pt','es']:
+            for s_idx in range(32):
+                lines = []
+                for r_idx in range(32):
+                    # V89: Correção para buscar o texto traduzido (se existir)
+                    c_obj = conds.get((s_idx, r_idx))
+                    txt_val = ""
+                    if c_obj:
+                        if l_code == 'en': txt_val = c_obj.condition_text_en
+                        elif l_code == 'pt': txt_val = c_obj.condition_text_pt
+                        else: txt_val = c_obj.condition_text_es
+                        if txt_val and c_obj.condition_logic and c_obj.condition_logic != 'N/A':
+                            txt_val += f" {c_obj.condition_logic}"
+                    lines.append(txt_val or "")
+                row.append(",".join(lines))
+        for l_code in ['en','pt','es']:
+            descs_vals = []
+            for r_idx in range(32):
+                d_obj = descs.get(r_idx)
+                val = ""
+                if d_obj:
+                    if l_code=='en': val = d_obj.descricao_en
+                    elif l_code=='pt': val = d_obj.descricao_pt
+                    else: val = d_obj.descricao_es
+                descs_vals.append(val or "")
+            row.append(",".join(descs_vals))
+        w.writerow(row)
+    return _csv_bytes(output_buffer), len(phases)
+
+MASTER_EXPORT_SHEETS = [('Areas', export_master_areas), ('Unidades', export_master_unidades), ('Phases', export_master_phases), ('Parametros', export_master_params),
+                        ('Passos', export_master_steps), ('Interlocks', export_master_interlocks), ('Transicoes', export_master_transitions)]
+
+# Artefato -> (função, nome do ficheiro a partir do projeto, mimetype). Usado pelas rotas e por batch_export.py
+EXPORT_ARTIFACTS = {
+    'master_xlsx': (export_master_xlsx, "Master_{project}.xlsx", 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'phases_csv': (export_archestra_phases_csv, "{project}_Phases_Archestra.csv", 'text/csv'),
+    'steps_zip': (export_steps_zip, "{project}_Steps.zip", 'application/zip'),
+    'params_csv': (export_archestra_params_csv, "{project}_Params_Archestra.csv", 'text/csv'),
+    'interlocks_csv': (export_archestra_interlocks_csv, "{project}_Interlocks_Archestra.csv", 'text/csv'),
+    'transitions_csv': (export_archestra_transitions_csv, "{project}_Transitions_Archestra.csv", 'text/csv'),
+}
+
+# Botão do formulário da página inicial -> artefato
+EXPORT_FORM_ARTIFACTS = {'form_export_master_excel': 'master_xlsx', 'form_gerar_csv': 'phases_csv', 'form_gerar_zip': 'steps_zip',
+                         'form_gerar_param_csv': 'params_csv', 'form_gerar_interlock_csv': 'interlocks_csv', 'form_gerar_transition_csv': 'transitions_csv'}
+
+def export_artifact(dbsession, artifact, project_name, aid=None, uid=None, tipo=None, **kwargs):
+    """Gera um artefato. Retorna (nome_do_ficheiro, bytes, nº de itens exportados)"""
+    export_fn, file_pattern, _ = EXPORT_ARTIFACTS[artifact]
+    data, count = export_fn(dbsession, aid=aid, uid=uid, tipo=tipo, **kwargs)
+    return file_pattern.format(project=project_name), data, count
+
 # --- FUNÇÃO IMPORTAÇÃO/MERGE (v91: melhorado com logging) ---
-def import_master_excel(dbsession, file_storage):
-    """Importa Master Excel substituindo todos os dados (v91: com logging)"""
-    logger.info("Iniciando importação total (substituição)")
-    dbsession.query(TransitionConditions).delete()
-    dbsession.query(TransitionRowDescriptions).delete()
-    dbsession.query(Passos).delete()
-    dbsession.query(Parametros).delete()
-    dbsession.query(Interlocks).delete()
-    dbsession.query(Phases).delete()
-    dbsession.query(Unidades).delete()
-    dbsession.query(Areas).delete()
-    dbsession.commit()
-    logger.info("Dados antigos removidos")
+def bulk_load_master(connection, sheets):
+    """Carrega as folhas do Master numa base vazia com INSERTs em massa (v105).
+
+    Mesmas regras da mesclagem (a primeira ocorrência de cada chave ganha, filhos
+    sem pai são ignorados), mas os ids são atribuídos aqui e cada tabela vai num
+    único executemany, sem ORM nem flush por linha. As traduções das condições são
+    feitas uma vez por texto. Retorna {tabela: linhas}.
+    """
+    translations = {}
+    def translate(text):
+        if text not in translations:
+            translations[text] = auto_translate(text)
+        return translations[text]
+    records = lambda name: sheets[name].to_dict('records') if name in sheets else []
+    key3 = lambda r: (str(r.get('Area', '')).strip(), str(r.get('Unidade', '')).strip(), str(r.get('Phase', '')).strip())
+    rows = {t.__tablename__: [] for t in (Areas, Unidades, Phases, Parametros, Passos, Interlocks, TransitionRowDescriptions, TransitionConditions)}
+    area_ids, unit_ids, unit_names, phase_ids = {}, {}, set(), {}
+    for r in records('Areas'):
+        an = str(r.get('Nome_Area', '')).strip()
+        if an and an not in area_ids:
+            area_ids[an] = len(area_ids) + 1
+            rows['areas'].append({'area_id': area_ids[an], 'nome_area': an, 'descricao': r.get('Descricao_Area', '')})
+    for r in records('Unidades'):
+        an, un = str(r.get('Area', '')).strip(), str(r.get('Nome_Unidade', '')).strip()
+        if an in area_ids and un and un not in unit_names:
+            unit_ids[(an, un)] = len(unit_ids) + 1; unit_names.add(un)
+            rows['unidades'].append({'unidade_id': unit_ids[(an, un)], 'nome_unidade': un, 'area_id': area_ids[an], 'descricao': r.get('Descricao_Unidade', '')})
+    for r in records('Phases'):
+        k = key3(r)
+        if k[:2] in unit_ids and k[2] and k not in phase_ids:
+            phase_ids[k] = len(phase_ids) + 1
+            rows['phases'].append({'phase_id': phase_ids[k], 'unidade_id': unit_ids[k[:2]], 'nome_phase': k[2], 'tipo_phase': r.get('Tipo') or 'PH', 'descricao_pt': r.get('Desc_PT'), 'descricao_en': r.get('Desc_EN'), 'descricao_es': r.get('Desc_ES')})
+    seen = set()
+    for r in records('Parametros'):
+        pid = phase_ids.get(key3(r))
+        if pid is None: continue
+        num, cls = int(r['Numero']), r['Classe']
+        if (pid, cls, num) in seen: continue
+        seen.add((pid, cls, num))
+        rows['parametros'].append({'phase_id': pid, 'numero_param': num, 'classe_param': cls, 'nome_param': f"{cls}{num:03d}", 'tipo_dado': r['Tipo'], 'descricao_pt': r.get('Desc_PT'), 'descricao_en': r.get('Desc_EN'), 'descricao_es': r.get('Desc_ES'), 'valor_default': str(r['Default']), 'valor_min': str(r['Min']), 'valor_max': str(r['Max']), 'unidade_engenharia': r.get('Unidade_Eng')})
+    seen = set()
+    for r in records('Passos'):
+        pid = phase_ids.get(key3(r))
+        if pid is None: continue
+        idx = int(r['Index'])
+        if (pid, idx) in seen: continue
+        seen.add((pid, idx))
+        rows['passos'].append({'phase_id': pid, 'numero_passo': idx, 'codigo_passo': str(r['Step_Number']).split('.')[0] if str(r['Step_Number']) != '' else None, 'descricao_pt': r.get('Desc_PT'), 'descricao_en': r.get('Desc_EN'), 'descricao_es': r.get('Desc_ES')})
+    seen = set()
+    for r in records('Interlocks'):
+        pid = phase_ids.get(key3(r))
+        if pid is None or not str(r.get('Bit', '')).isdigit(): continue
+        bit = int(r['Bit'])
+        if (pid, bit) in seen: continue
+        seen.add((pid, bit))
+        rows['interlocks'].append({'phase_id': pid, 'numero_interlock': bit, 'seguranca_pt': r.get('Seg_PT'), 'seguranca_en': r.get('Seg_EN'), 'seguranca_es': r.get('Seg_ES'), 'processo_pt': r.get('Proc_PT'), 'processo_en': r.get('Proc_EN'), 'processo_es': r.get('Proc_ES')})
+    seen_trd, seen_tc = set(), set()
+    for r in records('Transicoes'):
+        pid = phase_ids.get(key3(r))
+        if pid is None: continue
+        rnum = int(r['Bit_Linha'])
+        if (pid, rnum) not in seen_trd and (r.get('Desc_Linha_PT') or r.get('Desc_Linha_EN') or r.get('Desc_Linha_ES')):
+            seen_trd.add((pid, rnum))
+            rows['TransitionRowDescriptions'].append({'phase_id': pid, 'row_number': rnum, 'descricao_pt': r.get('Desc_Linha_PT'), 'descricao_en': r.get('Desc_Linha_EN'), 'descricao_es': r.get('Desc_Linha_ES')})
+        for step_idx in range(32):
+            cell = r.get(f'Step_{step_idx}')
+            if cell is None or not str(cell).strip() or (pid, step_idx, rnum) in seen_tc: continue
+            seen_tc.add((pid, step_idx, rnum))
+            txt, logic = parse_logic_from_text(cell); en, es = translate(txt)
+            rows['TransitionConditions'].append({'phase_id': pid, 'step_index': step_idx, 'condition_row': rnum, 'condition_text_pt': txt, 'condition_logic': logic, 'condition_text_en': en, 'condition_text_es': es})
+    for table in Base.metadata.sorted_tables:
+        if rows.get(table.name):
+            connection.execute(table.insert(), rows[table.name])
+    counts = {name: len(table_rows) for name, table_rows in rows.items()}
+    logger.info(f"Carga em massa do Master: {counts}")
+    return counts
+
+def _sqlite_bulk_load_on_connect(dbapi_conn, conn_record):
+    """v93: Base sombra é descartável até ao swap, por isso dispensa journal e fsync"""
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.execute('PRAGMA journal_mode=OFF')
+    cursor.execute('PRAGMA synchronous=OFF')
+    cursor.execute('PRAGMA cache_size=-65536')
+    cursor.close()
+
+def validate_project_db(engine):
+    """Valida integridade e FKs de uma base antes de a pôr em produção (v93)"""
+    with engine.connect() as conn:
+        integrity = conn.exec_driver_sql('PRAGMA integrity_check').fetchone()[0]
+        if integrity != 'ok':
+            raise Exception(f"integrity_check falhou: {integrity}")
+        orphans = conn.exec_driver_sql('PRAGMA foreign_key_check').fetchall()
+        if orphans:
+            raise Exception(f"{len(orphans)} linhas com FK inválida")
+        version = conn.exec_driver_sql('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            raise Exception(f"Versão de schema inesperada: {version}")
+        return {t.name: conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{t.name}"').fetchone()[0] for t in Base.metadata.sorted_tables}
+
+def swap_project_db(project_name, new_path, snapshot_label=None):
+    """Copia a base sombra por cima do projeto e apaga-a (v93; v105: numa escrita exclusiva do escritor).
+
+    Com WAL o ficheiro não é trocado com os.replace (o -wal do antigo seria aplicado
+    ao novo): as páginas são escritas no próprio ficheiro pela conexão do escritor,
+    numa transação, depois das escritas já em fila e antes das seguintes. Com
+    `snapshot_label`, o snapshot automático é tirado dentro da mesma pausa do
+    escritor: tem todas as escritas que a cópia vai descartar.
+    """
+    def copy_into(ds):
+        if snapshot_label and SNAPSHOT_BEFORE_REPLACE:
+            snapshot_project(project_name, snapshot_label, auto=True)
+        raw = ds.get_bind().raw_connection()  # a conexão única do escritor, ainda sem transação
+        try:
+            copy_database_into(new_path, raw.driver_connection)
+        finally:
+            raw.close()
+    run_write(project_name, copy_into, exclusive=True, timeout=None)
+    os.remove(new_path)
+    logger.info(f"Base de dados do projeto {project_name} substituída")
+
+def delete_project_db(project_name):
+    """Fecha escritor e engine e apaga o ficheiro do projeto com os do WAL (v105)"""
+    close_writer(project_name)
+    with _engines_lock:
+        engine = engines.pop(project_name, None)
+        _engine_file_ids.pop(project_name, None)
+        if engine is not None:
+            engine.dispose()  # Windows não permite apagar o ficheiro aberto
+    db_path = os.path.join(DATABASE_FOLDER, project_name)
+    os.remove(db_path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+def replace_project_db(project_name, fill_fn):
+    """Constrói o projeto numa base sombra e troca-a pela do projeto (v93).
+
+    `fill_fn(session)` popula a base sombra (vazia, criada a partir do template).
+    Os leitores continuam a ver o projeto antigo durante toda a carga; uma
+    falha deixa o projeto intacto.
+    """
+    db_path = os.path.join(DATABASE_FOLDER, project_name)
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Base de dados {project_name} não encontrada.")
+    shadow_path = f"{db_path}.shadow"
+    if os.path.exists(shadow_path):
+        os.remove(shadow_path)
+    template_path = get_template_path()
+    if template_path:
+        backup_database(template_path, shadow_path)  # v104: API de backup em vez de cópia do ficheiro
+    shadow_engine = create_engine(f'sqlite:///{shadow_path}', poolclass=StaticPool, connect_args={'check_same_thread': False}, echo=False)
+    event.listen(shadow_engine, 'connect', _sqlite_bulk_load_on_connect)
     try:
-        merge_master_excel(dbsession, io.BytesIO(file_storage.read()))
-        logger.info("Importação total concluída com sucesso")
+        Base.metadata.create_all(shadow_engine)
+        migrate_schema(shadow_engine)
+        shadow_session = sessionmaker(bind=shadow_engine)()
+        try:
+            shadow_session.query(Areas).delete(synchronize_session=False)
+            fill_fn(shadow_session)
+            shadow_session.commit()
+        finally:
+            shadow_session.close()
+        counts = validate_project_db(shadow_engine)
+        shadow_engine.dispose()
+        swap_project_db(project_name, shadow_path, 'antes-substituicao')
+        logger.info(f"Substituição atómica de {project_name} concluída: {counts}")
+        return counts
     except Exception as e:
-        logger.error(f"Erro na importação total: {e}")
-        dbsession.rollback()
+        logger.error(f"Erro na importação atómica de {project_name}: {e}")
+        shadow_engine.dispose()
+        if os.path.exists(shadow_path):
+            os.remove(shadow_path)
         raise Exception(f"Erro na importação: {e}")
 
-def merge_master_excel(dbsession, file_storage):
-    """Mescla dados do Excel sem apagar existentes (v91: otimizado)"""
+def import_master_excel_atomic(project_name, file_storage):
+    """Importa Master Excel substituindo todos os dados via base sombra (v93)"""
+    logger.info(f"Iniciando importação atómica (substituição) para {project_name}")
+    from master_ingest import read_master_sheets
+    sheets = read_master_sheets(file_storage)  # v105: lido antes de criar a base sombra; carga em massa (sem ORM)
+    return replace_project_db(project_name, lambda ds: bulk_load_master(ds.connection(), sheets))
+
+def import_project_bundle(project_name, file_storage):
+    """Substitui o projeto pelo conteúdo de um pacote binário (v96)"""
+    logger.info(f"Iniciando importação de pacote para {project_name}")
+    _, tables = read_bundle(file_storage, SCHEMA_VERSION, [t.name for t in Base.metadata.sorted_tables])
+    return replace_project_db(project_name, lambda ds: load_bundle_tables(ds.connection(), Base.metadata, tables))
+
+def merge_master_excel(dbsession, sheets, translations=None):
+    """Mescla dados do Excel (ou pasta de CSVs, v95) sem apagar existentes (v91: otimizado)
+
+    v105: Recebe as folhas já lidas (read_master_sheets) e as traduções feitas no
+    pedido (prepare_master_translations); na thread escritora só ficam as escritas.
+    """
     logger.info("Iniciando mesclagem de dados")
+    translate = _translation_lookup(translations)
     try:
-        if hasattr(file_storage, 'seek'):
-            file_storage.seek(0)
-        else:
-            file_storage = io.BytesIO(file_storage.read())
-        xls_file = pd.ExcelFile(file_storage)
-        logger.info(f"Planilhas encontradas: {xls_file.sheet_names}")
+        logger.info(f"Planilhas encontradas: {list(sheets)}")
         ac_obj={a.nome_area:a for a in dbsession.query(Areas).all()}; uc_obj={(u.area.nome_area,u.nome_unidade):u for u in dbsession.query(Unidades).options(joinedload(Unidades.area)).all()}; pc_obj={(p.unidade.area.nome_area,p.unidade.nome_unidade,p.nome_phase):p for p in dbsession.query(Phases).options(joinedload(Phases.unidade).joinedload(Unidades.area)).all()}
         existing_areas_set = set(ac_obj.keys()); existing_units_set = {u_val.nome_unidade for u_val in uc_obj.values()}; existing_phases_set = {(p_val.unidade_id, p_val.nome_phase) for p_val in pc_obj.values()} 
         param_c_set = {(p.phase_id, p.classe_param, p.numero_param) for p in dbsession.query(Parametros.phase_id, Parametros.classe_param, Parametros.numero_param).all()}
@@ -325,40 +950,40 @@ def merge_master_excel(dbsession, file_storage):
         trd_c_set = {(d.phase_id, d.row_number) for d in dbsession.query(TransitionRowDescriptions.phase_id, TransitionRowDescriptions.row_number).all()}
         tc_c_set = {(c.phase_id, c.step_index, c.condition_row) for c in dbsession.query(TransitionConditions.phase_id, TransitionConditions.step_index, TransitionConditions.condition_row).all()}
 
-        if 'Areas' in xls_file.sheet_names:
-            for _, r_ar in pd.read_excel(xls_file, 'Areas').fillna('').iterrows():
+        if 'Areas' in sheets:
+            for r_ar in sheets['Areas'].to_dict('records'):
                 an_val = str(r_ar.get('Nome_Area', '')).strip()
                 if an_val and an_val not in existing_areas_set: a_new=Areas(nome_area=an_val, descricao=r_ar.get('Descricao_Area','')); dbsession.add(a_new); dbsession.flush(); ac_obj[an_val]=a_new; existing_areas_set.add(an_val)
-        if 'Unidades' in xls_file.sheet_names:
-            for _, r_un in pd.read_excel(xls_file, 'Unidades').fillna('').iterrows():
+        if 'Unidades' in sheets:
+            for r_un in sheets['Unidades'].to_dict('records'):
                 an_val, un_val = str(r_un.get('Area', '')).strip(), str(r_un.get('Nome_Unidade', '')).strip()
                 if an_val in ac_obj and un_val and un_val not in existing_units_set: u_new=Unidades(nome_unidade=un_val, area_id=ac_obj[an_val].area_id, descricao=r_un.get('Descricao_Unidade','')); dbsession.add(u_new); dbsession.flush(); uc_obj[(an_val,un_val)]=u_new; existing_units_set.add(un_val)
-        if 'Phases' in xls_file.sheet_names:
-            for _, r_ph in pd.read_excel(xls_file, 'Phases').fillna('').iterrows():
+        if 'Phases' in sheets:
+            for r_ph in sheets['Phases'].to_dict('records'):
                 an_val, un_val, pn_val = str(r_ph.get('Area', '')).strip(), str(r_ph.get('Unidade', '')).strip(), str(r_ph.get('Phase', '')).strip()
                 if (an_val,un_val) in uc_obj and pn_val:
                     uid_val = uc_obj[(an_val,un_val)].unidade_id
                     if (uid_val, pn_val) not in existing_phases_set: p_new=Phases(unidade_id=uid_val, nome_phase=pn_val, tipo_phase=r_ph.get('Tipo','PH'), descricao_pt=r_ph.get('Desc_PT'), descricao_en=r_ph.get('Desc_EN'), descricao_es=r_ph.get('Desc_ES')); dbsession.add(p_new); dbsession.flush(); pc_obj[(an_val,un_val,pn_val)]=p_new; existing_phases_set.add((uid_val, pn_val))
-        if 'Parametros' in xls_file.sheet_names:
-            for _, r_pm in pd.read_excel(xls_file, 'Parametros').fillna('').iterrows():
+        if 'Parametros' in sheets:
+            for r_pm in sheets['Parametros'].to_dict('records'):
                 k_val = (str(r_pm.get('Area', '')).strip(), str(r_pm.get('Unidade', '')).strip(), str(r_pm.get('Phase', '')).strip())
                 if k_val in pc_obj:
                     pid_val = pc_obj[k_val].phase_id; num_val = int(r_pm['Numero']); cls_val = r_pm['Classe']
                     if (pid_val, cls_val, num_val) not in param_c_set: dbsession.add(Parametros(phase_id=pid_val, numero_param=num_val, classe_param=cls_val, nome_param=f"{cls_val}{num_val:03d}", tipo_dado=r_pm['Tipo'], descricao_pt=r_pm.get('Desc_PT'), descricao_en=r_pm.get('Desc_EN'), descricao_es=r_pm.get('Desc_ES'), valor_default=str(r_pm['Default']), valor_min=str(r_pm['Min']), valor_max=str(r_pm['Max']), unidade_engenharia=r_pm.get('Unidade_Eng'))); param_c_set.add((pid_val, cls_val, num_val))
-        if 'Passos' in xls_file.sheet_names:
-            for _, r_st in pd.read_excel(xls_file, 'Passos').fillna('').iterrows():
+        if 'Passos' in sheets:
+            for r_st in sheets['Passos'].to_dict('records'):
                 k_val = (str(r_st.get('Area', '')).strip(), str(r_st.get('Unidade', '')).strip(), str(r_st.get('Phase', '')).strip())
                 if k_val in pc_obj:
                     pid_val = pc_obj[k_val].phase_id; idx_val = int(r_st['Index'])
                     if (pid_val, idx_val) not in step_c_set: s_new = Passos(phase_id=pid_val, numero_passo=idx_val, codigo_passo=str(r_st['Step_Number']).split('.')[0] if str(r_st['Step_Number'])!='' else None, descricao_pt=r_st.get('Desc_PT'), descricao_en=r_st.get('Desc_EN'), descricao_es=r_st.get('Desc_ES')); dbsession.add(s_new); step_c_set.add((pid_val, idx_val))
-        if 'Interlocks' in xls_file.sheet_names:
-            for _, r_il in pd.read_excel(xls_file, 'Interlocks').fillna('').iterrows():
+        if 'Interlocks' in sheets:
+            for r_il in sheets['Interlocks'].to_dict('records'):
                 k_val = (str(r_il.get('Area', '')).strip(), str(r_il.get('Unidade', '')).strip(), str(r_il.get('Phase', '')).strip())
                 if k_val in pc_obj and str(r_il.get('Bit','')).isdigit():
                     pid_val = pc_obj[k_val].phase_id; bit_val = int(r_il['Bit'])
                     if (pid_val, bit_val) not in ilk_c_set: dbsession.add(Interlocks(phase_id=pid_val, numero_interlock=bit_val, seguranca_pt=r_il.get('Seg_PT'), seguranca_en=r_il.get('Seg_EN'), seguranca_es=r_il.get('Seg_ES'), processo_pt=r_il.get('Proc_PT'), processo_en=r_il.get('Proc_EN'), processo_es=r_il.get('Proc_ES'))); ilk_c_set.add((pid_val, bit_val))
-        if 'Transicoes' in xls_file.sheet_names:
-            for _, r_tr in pd.read_excel(xls_file, 'Transicoes').fillna('').iterrows():
+        if 'Transicoes' in sheets:
+            for r_tr in sheets['Transicoes'].to_dict('records'):
                 k_val = (str(r_tr.get('Area', '')).strip(), str(r_tr.get('Unidade', '')).strip(), str(r_tr.get('Phase', '')).strip())
                 if k_val not in pc_obj: continue
                 pid_val = pc_obj[k_val].phase_id; rnum_val = int(r_tr['Bit_Linha'])
@@ -368,7 +993,7 @@ def merge_master_excel(dbsession, file_storage):
                     col_name_tr = f'Step_{step_col_idx_imp}'
                     if col_name_tr in r_tr and str(r_tr[col_name_tr]).strip():
                         if (pid_val, step_col_idx_imp, rnum_val) not in tc_c_set:
-                            txt_val, log_val = parse_logic_from_text(r_tr[col_name_tr]); en_val, es_val = auto_translate(txt_val)
+                            txt_val, log_val = parse_logic_from_text(r_tr[col_name_tr]); en_val, es_val = translate(txt_val)
                             dbsession.add(TransitionConditions(phase_id=pid_val, step_index=step_col_idx_imp, condition_row=rnum_val, condition_text_pt=txt_val, condition_logic=log_val, condition_text_en=en_val, condition_text_es=es_val)); tc_c_set.add((pid_val, step_col_idx_imp, rnum_val))
         dbsession.commit()
         logger.info("Mesclagem de dados concluída com sucesso")
@@ -377,6 +1002,331 @@ def merge_master_excel(dbsession, file_storage):
         dbsession.rollback()
         raise Exception(f"Erro durante a mesclagem: {e}")
 
+# --- MESCLAGEM COM ATUALIZAÇÃO (v94) ---
+def _xl_str(value):
+    """Normaliza célula do Excel / valor da BD para texto comparável"""
+    if value is None or (isinstance(value, float) and pd.isna(value)): return ''
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    return str(value).strip()
+
+def _same_value(db_value, xl_value):
+    """Compara ignorando diferenças de arredondamento de floats no round-trip pelo Excel"""
+    a, b = _xl_str(db_value), _xl_str(xl_value)
+    if a == b: return True
+    try: return math.isclose(float(a), float(b), rel_tol=1e-12)
+    except ValueError: return False
+
+def _merge_translations(pt, en, es, cur, pt_col, en_col, es_col, translate=auto_translate):
+    """Só traduz quando o PT mudou (ou é novo) e a planilha não trouxe EN/ES editados"""
+    if cur is not None and _xl_str(cur[pt_col]) == pt:
+        return en or _xl_str(cur[en_col]), es or _xl_str(cur[es_col])
+    if cur is not None:
+        # PT mudou: EN/ES iguais aos da BD são traduções do texto antigo
+        if en == _xl_str(cur[en_col]): en = ''
+        if es == _xl_str(cur[es_col]): es = ''
+    if pt and not (en and es):
+        en_auto, es_auto = translate(pt)
+        en, es = en or en_auto, es or es_auto
+    return en, es
+
+def _upsert_rows(dbsession, model, key_cols, rows, existing):
+    """INSERT ... ON CONFLICT DO UPDATE em lotes; só envia linhas novas ou alteradas"""
+    stats = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    to_write = []
+    for key, row in rows.items():
+        cur = existing.get(key)
+        if cur is None:
+            stats['inserted'] += 1; to_write.append(row)
+        elif not all(_same_value(cur[c], v) for c, v in row.items() if c not in key_cols):
+            stats['updated'] += 1; to_write.append(row)
+        else:
+            stats['unchanged'] += 1
+    if to_write:
+        stmt = sqlite_insert(model.__table__)
+        update_cols = [c for c in to_write[0] if c not in key_cols]
+        stmt = stmt.on_conflict_do_update(index_elements=key_cols, set_={c: stmt.excluded[c] for c in update_cols})
+        for start in range(0, len(to_write), UPSERT_BATCH_SIZE):
+            dbsession.execute(stmt, to_write[start:start + UPSERT_BATCH_SIZE])
+    logger.info(f"Upsert {model.__tablename__}: {stats}")
+    return stats
+
+def _existing_rows(dbsession, model, key_cols, value_cols):
+    cols = [getattr(model, c) for c in key_cols + value_cols]
+    return {tuple(r[c] for c in key_cols): r for r in dbsession.execute(select(*cols)).mappings()}
+
+def _phase_id_map(dbsession):
+    return {(a, u, p): pid for pid, a, u, p in dbsession.execute(select(Phases.phase_id, Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase).join(Unidades, Phases.unidade_id == Unidades.unidade_id).join(Areas, Unidades.area_id == Areas.area_id))}
+
+def upsert_master_excel(dbsession, sheets, translations=None):
+    """Mescla o Master Excel inserindo linhas novas e atualizando as alteradas (v94).
+
+    Usa as UniqueConstraints existentes como alvo do ON CONFLICT. Retorna
+    {tabela: {'inserted', 'updated', 'unchanged'}}. v105: folhas e traduções
+    chegam preparadas, como em merge_master_excel.
+    """
+    logger.info("Iniciando mesclagem com atualização (upsert)")
+    translate = _translation_lookup(translations)
+    try:
+        sheets = {name: df.to_dict('records') for name, df in sheets.items()}
+        summary = {}
+        key3 = lambda r: (_xl_str(r.get('Area')), _xl_str(r.get('Unidade')), _xl_str(r.get('Phase')))
+
+        if 'Areas' in sheets:
+            rows = {}
+            for r in sheets['Areas']:
+                an = _xl_str(r.get('Nome_Area'))
+                if an: rows[(an,)] = {'nome_area': an, 'descricao': _xl_str(r.get('Descricao_Area')) or None}
+            summary['areas'] = _upsert_rows(dbsession, Areas, ['nome_area'], rows, _existing_rows(dbsession, Areas, ['nome_area'], ['descricao']))
+        area_ids = {n: i for i, n in dbsession.execute(select(Areas.area_id, Areas.nome_area))}
+
+        if 'Unidades' in sheets:
+            rows = {}
+            for r in sheets['Unidades']:
+                an, un = _xl_str(r.get('Area')), _xl_str(r.get('Nome_Unidade'))
+                if an in area_ids and un: rows[(un,)] = {'nome_unidade': un, 'area_id': area_ids[an], 'descricao': _xl_str(r.get('Descricao_Unidade')) or None}
+            summary['unidades'] = _upsert_rows(dbsession, Unidades, ['nome_unidade'], rows, _existing_rows(dbsession, Unidades, ['nome_unidade'], ['area_id', 'descricao']))
+        unit_ids = {(a, u): i for i, a, u in dbsession.execute(select(Unidades.unidade_id, Areas.nome_area, Unidades.nome_unidade).join(Areas, Unidades.area_id == Areas.area_id))}
+
+        if 'Phases' in sheets:
+            existing = _existing_rows(dbsession, Phases, ['unidade_id', 'nome_phase'], ['tipo_phase', 'descricao_pt', 'descricao_en', 'descricao_es'])
+            rows = {}
+            for r in sheets['Phases']:
+                an, un, pn = key3(r)
+                if (an, un) not in unit_ids or not pn: continue
+                key = (unit_ids[(an, un)], pn); d_pt = _xl_str(r.get('Desc_PT'))
+                d_en, d_es = _merge_translations(d_pt, _xl_str(r.get('Desc_EN')), _xl_str(r.get('Desc_ES')), existing.get(key), 'descricao_pt', 'descricao_en', 'descricao_es', translate)
+                rows[key] = {'unidade_id': key[0], 'nome_phase': pn, 'tipo_phase': _xl_str(r.get('Tipo')) or 'PH', 'descricao_pt': d_pt or None, 'descricao_en': d_en or None, 'descricao_es': d_es or None}
+            summary['phases'] = _upsert_rows(dbsession, Phases, ['unidade_id', 'nome_phase'], rows, existing)
+        phase_ids = _phase_id_map(dbsession)
+
+        if 'Parametros' in sheets:
+            existing = _existing_rows(dbsession, Parametros, ['phase_id', 'classe_param', 'numero_param'], ['nome_param', 'tipo_dado', 'descricao_pt', 'descricao_en', 'descricao_es', 'valor_default', 'valor_min', 'valor_max', 'unidade_engenharia'])
+            rows = {}
+            for r in sheets['Parametros']:
+                pid = phase_ids.get(key3(r))
+                if pid is None: continue
+                cls, num = _xl_str(r.get('Classe')), int(r['Numero'])
+                key = (pid, cls, num); d_pt = _xl_str(r.get('Desc_PT'))
+                d_en, d_es = _merge_translations(d_pt, _xl_str(r.get('Desc_EN')), _xl_str(r.get('Desc_ES')), existing.get(key), 'descricao_pt', 'descricao_en', 'descricao_es', translate)
+                rows[key] = {'phase_id': pid, 'classe_param': cls, 'numero_param': num, 'nome_param': f"{cls}{num:03d}", 'tipo_dado': _xl_str(r.get('Tipo')), 'descricao_pt': d_pt or None, 'descricao_en': d_en or None, 'descricao_es': d_es or None, 'valor_default': _xl_str(r.get('Default')), 'valor_min': _xl_str(r.get('Min')), 'valor_max': _xl_str(r.get('Max')), 'unidade_engenharia': _xl_str(r.get('Unidade_Eng')) or None}
+            summary['parametros'] = _upsert_rows(dbsession, Parametros, ['phase_id', 'classe_param', 'numero_param'], rows, existing)
+
+        if 'Passos' in sheets:
+            existing = _existing_rows(dbsession, Passos, ['phase_id', 'numero_passo'], ['codigo_passo', 'descricao_pt', 'descricao_en', 'descricao_es'])
+            rows = {}
+            for r in sheets['Passos']:
+                pid = phase_ids.get(key3(r))
+                if pid is None: continue
+                key = (pid, int(r['Index'])); d_pt = _xl_str(r.get('Desc_PT'))
+                d_en, d_es = _merge_translations(d_pt, _xl_str(r.get('Desc_EN')), _xl_str(r.get('Desc_ES')), existing.get(key), 'descricao_pt', 'descricao_en', 'descricao_es', translate)
+                rows[key] = {'phase_id': pid, 'numero_passo': key[1], 'codigo_passo': _xl_str(r.get('Step_Number')).split('.')[0] or None, 'descricao_pt': d_pt or None, 'descricao_en': d_en or None, 'descricao_es': d_es or None}
+            summary['passos'] = _upsert_rows(dbsession, Passos, ['phase_id', 'numero_passo'], rows, existing)
+
+        if 'Interlocks' in sheets:
+            existing = _existing_rows(dbsession, Interlocks, ['phase_id', 'numero_interlock'], ['seguranca_pt', 'seguranca_en', 'seguranca_es', 'processo_pt', 'processo_en', 'processo_es'])
+            rows = {}
+            for r in sheets['Interlocks']:
+                pid = phase_ids.get(key3(r))
+                if pid is None or not _xl_str(r.get('Bit')).isdigit(): continue
+                key = (pid, int(_xl_str(r.get('Bit')))); cur = existing.get(key)
+                s_pt, p_pt = _xl_str(r.get('Seg_PT')), _xl_str(r.get('Proc_PT'))
+                if not (s_pt or p_pt) and cur is None: continue
+                s_en, s_es = _merge_translations(s_pt, _xl_str(r.get('Seg_EN')), _xl_str(r.get('Seg_ES')), cur, 'seguranca_pt', 'seguranca_en', 'seguranca_es', translate)
+                p_en, p_es = _merge_translations(p_pt, _xl_str(r.get('Proc_EN')), _xl_str(r.get('Proc_ES')), cur, 'processo_pt', 'processo_en', 'processo_es', translate)
+                rows[key] = {'phase_id': pid, 'numero_interlock': key[1], 'seguranca_pt': s_pt or None, 'seguranca_en': s_en or None, 'seguranca_es': s_es or None, 'processo_pt': p_pt or None, 'processo_en': p_en or None, 'processo_es': p_es or None}
+            summary['interlocks'] = _upsert_rows(dbsession, Interlocks, ['phase_id', 'numero_interlock'], rows, existing)
+
+        if 'Transicoes' in sheets:
+            existing_trd = _existing_rows(dbsession, TransitionRowDescriptions, ['phase_id', 'row_number'], ['descricao_pt', 'descricao_en', 'descricao_es'])
+            existing_tc = _existing_rows(dbsession, TransitionConditions, ['phase_id', 'step_index', 'condition_row'], ['condition_logic', 'condition_text_pt', 'condition_text_en', 'condition_text_es'])
+            rows_trd, rows_tc = {}, {}
+            for r in sheets['Transicoes']:
+                pid = phase_ids.get(key3(r))
+                if pid is None: continue
+                rnum = int(r['Bit_Linha']); d_pt, d_en, d_es = _xl_str(r.get('Desc_Linha_PT')), _xl_str(r.get('Desc_Linha_EN')), _xl_str(r.get('Desc_Linha_ES'))
+                if d_pt or d_en or d_es:
+                    key = (pid, rnum)
+                    d_en, d_es = _merge_translations(d_pt, d_en, d_es, existing_trd.get(key), 'descricao_pt', 'descricao_en', 'descricao_es', translate)
+                    rows_trd[key] = {'phase_id': pid, 'row_number': rnum, 'descricao_pt': d_pt or None, 'descricao_en': d_en or None, 'descricao_es': d_es or None}
+                for step_idx in range(32):
+                    cell = _xl_str(r.get(f'Step_{step_idx}'))
+                    if not cell: continue
+                    key = (pid, step_idx, rnum); txt, logic = parse_logic_from_text(cell)
+                    en, es = _merge_translations(txt, '', '', existing_tc.get(key), 'condition_text_pt', 'condition_text_en', 'condition_text_es', translate)
+                    rows_tc[key] = {'phase_id': pid, 'step_index': step_idx, 'condition_row': rnum, 'condition_logic': logic, 'condition_text_pt': txt, 'condition_text_en': en, 'condition_text_es': es}
+            summary['TransitionRowDescriptions'] = _upsert_rows(dbsession, TransitionRowDescriptions, ['phase_id', 'row_number'], rows_trd, existing_trd)
+            summary['TransitionConditions'] = _upsert_rows(dbsession, TransitionConditions, ['phase_id', 'step_index', 'condition_row'], rows_tc, existing_tc)
+
+        dbsession.commit()
+        logger.info(f"Mesclagem com atualização concluída: {summary}")
+        return summary
+    except Exception as e:
+        logger.error(f"Erro durante a mesclagem com atualização: {e}")
+        dbsession.rollback()
+        raise Exception(f"Erro durante a mesclagem: {e}")
+
+def _translation_lookup(translations):
+    """Tradução a partir das preparadas no pedido; auto_translate só para textos que não foram previstos"""
+    translations = translations or {}
+    return lambda text: translations[text] if text in translations else auto_translate(text)
+
+def _upsert_translation_texts(dbsession, sheets, collect):
+    """Percorre as folhas como upsert_master_excel, só com leituras, passando a `collect` cada texto a traduzir"""
+    key3 = lambda r: (_xl_str(r.get('Area')), _xl_str(r.get('Unidade')), _xl_str(r.get('Phase')))
+    unit_ids = {(a, u): i for i, a, u in dbsession.execute(select(Unidades.unidade_id, Areas.nome_area, Unidades.nome_unidade).join(Areas, Unidades.area_id == Areas.area_id))}
+    phase_ids = _phase_id_map(dbsession)
+    desc = ('descricao_pt', 'descricao_en', 'descricao_es')
+    def visit(sheet, model, key_cols, key_fn, fields):
+        if sheet not in sheets: return
+        existing = _existing_rows(dbsession, model, key_cols, [c for _, cols in fields for c in cols])
+        for r in sheets[sheet].to_dict('records'):
+            try: cur = existing.get(key_fn(r))  # pai novo (ainda sem id) -> linha nova
+            except (TypeError, ValueError): continue  # a mesclagem reporta o erro
+            for cells, cols in fields:
+                _merge_translations(*(_xl_str(r.get(c)) for c in cells), cur, *cols, collect)
+    visit('Phases', Phases, ['unidade_id', 'nome_phase'], lambda r: (unit_ids.get(key3(r)[:2]), key3(r)[2]), [(('Desc_PT', 'Desc_EN', 'Desc_ES'), desc)])
+    visit('Parametros', Parametros, ['phase_id', 'classe_param', 'numero_param'], lambda r: (phase_ids.get(key3(r)), _xl_str(r.get('Classe')), int(r['Numero'])), [(('Desc_PT', 'Desc_EN', 'Desc_ES'), desc)])
+    visit('Passos', Passos, ['phase_id', 'numero_passo'], lambda r: (phase_ids.get(key3(r)), int(r['Index'])), [(('Desc_PT', 'Desc_EN', 'Desc_ES'), desc)])
+    visit('Interlocks', Interlocks, ['phase_id', 'numero_interlock'], lambda r: (phase_ids.get(key3(r)), int(_xl_str(r.get('Bit')))),
+          [(('Seg_PT', 'Seg_EN', 'Seg_ES'), ('seguranca_pt', 'seguranca_en', 'seguranca_es')), (('Proc_PT', 'Proc_EN', 'Proc_ES'), ('processo_pt', 'processo_en', 'processo_es'))])
+    visit('Transicoes', TransitionRowDescriptions, ['phase_id', 'row_number'], lambda r: (phase_ids.get(key3(r)), int(r['Bit_Linha'])), [(('Desc_Linha_PT', 'Desc_Linha_EN', 'Desc_Linha_ES'), desc)])
+    if 'Transicoes' in sheets:
+        existing_tc = _existing_rows(dbsession, TransitionConditions, ['phase_id', 'step_index', 'condition_row'], ['condition_text_pt', 'condition_text_en', 'condition_text_es'])
+        for r in sheets['Transicoes'].to_dict('records'):
+            try: pid, rnum = phase_ids.get(key3(r)), int(r['Bit_Linha'])
+            except (TypeError, ValueError): continue
+            for step_idx in range(32):
+                cell = _xl_str(r.get(f'Step_{step_idx}'))
+                if cell: _merge_translations(parse_logic_from_text(cell)[0], '', '', existing_tc.get((pid, step_idx, rnum)), 'condition_text_pt', 'condition_text_en', 'condition_text_es', collect)
+
+def prepare_master_translations(dbsession, sheets, mode):
+    """Traduz no pedido os textos que a mesclagem (`mode` 'merge' ou 'upsert') vai precisar (v105).
+
+    Só leituras na sessão do pedido; a thread escritora recebe o dicionário e não
+    espera pela rede (as outras gravações do projeto não ficam bloqueadas). Um texto
+    que mude entretanto ainda é traduzido na escrita. Retorna {texto_pt: (en, es)}.
+    """
+    texts = set()
+    collect = lambda text: texts.add(text) or ('', '')
+    if mode == 'upsert':
+        _upsert_translation_texts(dbsession, sheets, collect)
+    elif 'Transicoes' in sheets:
+        key3 = lambda r: (str(r.get('Area', '')).strip(), str(r.get('Unidade', '')).strip(), str(r.get('Phase', '')).strip())
+        phase_ids = _phase_id_map(dbsession)
+        tc_c_set = {(c.phase_id, c.step_index, c.condition_row) for c in dbsession.query(TransitionConditions.phase_id, TransitionConditions.step_index, TransitionConditions.condition_row).all()}
+        for r_tr in sheets['Transicoes'].to_dict('records'):
+            try: pid_val, rnum_val = phase_ids.get(key3(r_tr)), int(r_tr['Bit_Linha'])
+            except (TypeError, ValueError): continue
+            for step_col_idx in range(32):
+                col_name_tr = f'Step_{step_col_idx}'
+                if col_name_tr in r_tr and str(r_tr[col_name_tr]).strip() and (pid_val, step_col_idx, rnum_val) not in tc_c_set:
+                    collect(parse_logic_from_text(r_tr[col_name_tr])[0])
+    started = time.perf_counter()
+    translations = {text: auto_translate(text) for text in texts}
+    logger.info(f"Traduções da mesclagem ({mode}): {len(translations)} textos em {time.perf_counter() - started:.2f}s")
+    return translations
+
+def merge_master_sheets(project_name, dbsession, sheets, update=False):
+    """Mescla (ou, com `update`, mescla com atualização) folhas já lidas; retorna o resumo do upsert ou None.
+
+    v105: Traduções no pedido (`dbsession` só de leitura); o escritor só recebe as escritas.
+    """
+    translations = prepare_master_translations(dbsession, sheets, 'upsert' if update else 'merge')
+    if update:
+        return run_write(project_name, lambda ds: upsert_master_excel(ds, sheets, translations), exclusive=True)
+    run_write(project_name, lambda ds: merge_master_excel(ds, sheets, translations), exclusive=True)
+    return None
+
+def format_upsert_summary(summary):
+    return "; ".join(f"{t}: +{s['inserted']} ~{s['updated']} ={s['unchanged']}" for t, s in summary.items())
+
+# --- SIMULAÇÃO DA IMPORTAÇÃO (v103) ---
+def dry_run_master_excel(dbsession, file_storage, mode):
+    """Compara a planilha com o projeto sem gravar (modo 'import', 'merge' ou 'upsert').
+
+    Retorna (resumo por tabela, DataFrame do relatório). Só leituras: folhas e
+    chaves atuais em DataFrames, sem ORM por linha e sem traduções.
+    """
+    from master_ingest import read_master_sheets
+    from master_diff import load_current, diff_master
+    sheets = read_master_sheets(file_storage)
+    return diff_master(sheets, load_current(dbsession.connection()), mode)
+
+def _dry_run_folder():
+    return os.path.join(DATABASE_FOLDER, DRY_RUN_FOLDER)
+
+def save_dry_run_report(project_name, report):
+    """Grava o relatório em CSV e devolve o token para o download; apaga os mais antigos (DRY_RUN_KEEP)"""
+    from master_diff import report_csv
+    folder = _dry_run_folder()
+    os.makedirs(folder, exist_ok=True)
+    token = f"{os.path.splitext(project_name)[0]}_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    tmp_path = os.path.join(folder, f"{token}.csv.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(report_csv(report))
+    os.replace(tmp_path, os.path.join(folder, f"{token}.csv"))
+    reports = sorted((e for e in os.scandir(folder) if e.name.endswith('.csv')), key=lambda e: e.stat().st_mtime, reverse=True)
+    for old in reports[DRY_RUN_KEEP:]:
+        try: os.remove(old.path)
+        except OSError: pass
+    return token
+
+# --- SNAPSHOTS (v104) ---
+def _snapshot_folder(project_name, auto=False):
+    folder = os.path.join(DATABASE_FOLDER, SNAPSHOT_FOLDER, os.path.splitext(project_name)[0])
+    return os.path.join(folder, SNAPSHOT_AUTO_FOLDER) if auto else folder
+
+def get_project_snapshots(project_name):
+    """Manuais e automáticos, mais recentes primeiro; os automáticos com nome 'auto/<ficheiro>' (v105)"""
+    auto = [dict(s, name=f"{SNAPSHOT_AUTO_FOLDER}/{s['name']}", auto=True) for s in list_snapshots(_snapshot_folder(project_name, auto=True))]
+    manual = [dict(s, auto=False) for s in list_snapshots(_snapshot_folder(project_name))]
+    return sorted(manual + auto, key=lambda s: (s['created'], s['name']), reverse=True)
+
+def _snapshot_path(project_name, snapshot_name):
+    return os.path.join(_snapshot_folder(project_name), *snapshot_name.split('/'))
+
+def snapshot_project(project_name, label=None, auto=False):
+    """Snapshot comprimido do projeto em uso (backup online em passos; leitores e escritor continuam)"""
+    db_path = os.path.join(DATABASE_FOLDER, project_name)
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"Base de dados {project_name} não encontrada.")
+    return create_snapshot(db_path, _snapshot_folder(project_name, auto), label, keep=SNAPSHOT_AUTO_KEEP if auto else SNAPSHOT_KEEP, max_age_days=SNAPSHOT_MAX_AGE_DAYS)
+
+def restore_project_snapshot(project_name, snapshot_name):
+    """Repõe um snapshot: descomprime para a base sombra, valida e troca (como replace_project_db)"""
+    if snapshot_name not in {s['name'] for s in get_project_snapshots(project_name)}:
+        raise FileNotFoundError(f"Snapshot {snapshot_name} não encontrado.")
+    db_path = os.path.join(DATABASE_FOLDER, project_name)
+    shadow_path = f"{db_path}.shadow"
+    try:
+        extract_snapshot(_snapshot_path(project_name, snapshot_name), shadow_path)
+        shadow_engine = create_engine(f'sqlite:///{shadow_path}', poolclass=StaticPool, connect_args={'check_same_thread': False}, echo=False)
+        try:
+            migrate_schema(shadow_engine)  # snapshots de versões anteriores do schema
+            counts = validate_project_db(shadow_engine)
+        finally:
+            shadow_engine.dispose()
+        swap_project_db(project_name, shadow_path, 'antes-restauro')
+        logger.info(f"Snapshot {snapshot_name} reposto em {project_name}: {counts}")
+        return counts
+    except Exception as e:
+        logger.error(f"Erro ao repor snapshot {snapshot_name} em {project_name}: {e}")
+        if os.path.exists(shadow_path):
+            os.remove(shadow_path)
+        raise Exception(f"Erro no restauro: {e}")
+
+def create_project_db(db_path, source_path=None):
+    """Cria um projeto novo a partir de `source_path` ou do template (True) ou vazio (False) (v96).
+
+    v104: A cópia usa a API de backup, por isso a origem pode ser um projeto em uso.
+    """
+    source_path = source_path or get_template_path()
+    if source_path:
+        backup_database(source_path, db_path)
+        return True
+    engine = create_engine(f'sqlite:///{db_path}'); Base.metadata.create_all(engine); engine.dispose()
+    return False
+
 # --- ROTAS ---
 @app.route('/', methods=['GET', 'POST'])
 def select_project():
@@ -385,194 +1335,112 @@ def select_project():
             p_name = request.form.get('project_name')
             if not p_name or ' ' in p_name or '.' in p_name: raise ValueError("Nome inválido.")
             db_path = os.path.join(DATABASE_FOLDER, f"{p_name}.db")
+            # v104: Opcionalmente clonado de um projeto existente
+            clone_from = request.form.get('clone_from')
+            if clone_from and clone_from not in list_projects(): raise ValueError("Projeto de origem inexistente.")
             if not os.path.exists(db_path):
-                template_path = os.path.join(basedir, TEMPLATE_DB_NAME)
-                if os.path.exists(template_path): shutil.copy(template_path, db_path); flash(f"Projeto '{p_name}' criado via template!", 'success')
-                else: engine = create_engine(f'sqlite:///{db_path}'); Base.metadata.create_all(engine); flash(f"Projeto '{p_name}' criado (vazio).", 'warning')
+                if clone_from: create_project_db(db_path, os.path.join(DATABASE_FOLDER, clone_from)); flash(f"Projeto '{p_name}' criado a partir de '{clone_from}'!", 'success')
+                elif create_project_db(db_path): flash(f"Projeto '{p_name}' criado via template!", 'success')
+                else: flash(f"Projeto '{p_name}' criado (vazio).", 'warning')
             else: flash(f"Projeto '{p_name}' já existe.", 'error')
         except Exception as e: flash(f"Erro: {e}", 'error')
         return redirect(url_for('select_project'))
-    return render_template('select_project.html', projects=[f for f in os.listdir(DATABASE_FOLDER) if f.endswith('.db') and f != TEMPLATE_DB_NAME])
+    return render_template('select_project.html', projects=list_projects())
 
 @app.route('/delete_project/<project_name>', methods=['POST'])
 def delete_project(project_name):
-    try: os.remove(os.path.join(DATABASE_FOLDER, project_name)); flash(f"Projeto '{project_name}' apagado.", 'success')
+    try: delete_project_db(project_name); flash(f"Projeto '{project_name}' apagado.", 'success')
     except Exception as e: flash(f"Erro: {e}", 'error')
     return redirect(url_for('select_project'))
 
 @app.route('/project/<project_name>/', methods=['GET', 'POST'])
 def index(project_name):
+    # v93: Substituição total corre fora da sessão, numa base sombra
+    # v103: Simulação (botão "Simular") de qualquer dos formulários do Master; só lê o projeto
+    if request.method == 'POST' and 'dry_run' in request.form:
+        return _handle_dry_run(project_name)
+    if request.method == 'POST' and 'form_import_master' in request.files:
+        return _handle_import_master(project_name)
+    if request.method == 'POST' and 'form_import_bundle' in request.files:
+        return _handle_import_bundle(project_name)
     with get_db_session(project_name) as dbsession:
         return _handle_index(project_name, dbsession)
 
+def _handle_import_master(project_name):
+    file = request.files['form_import_master']
+    if file.filename.lower().endswith(MASTER_UPLOAD_EXTENSIONS):
+        try: import_master_excel_atomic(project_name, file); flash("Master Data importado!", 'success')
+        except Exception as e_imp: flash(f"Erro Import: {e_imp}", 'error')
+    else: flash("Inválido.", 'error')
+    return redirect(url_for('index', project_name=project_name, tipo_filtrado=request.form.get('tipo_filtrado')))
+
+def _handle_dry_run(project_name):
+    file = request.files.get('form_import_master') or request.files.get('form_merge_master')
+    if file and file.filename.lower().endswith(MASTER_UPLOAD_EXTENSIONS):
+        mode = 'import' if 'form_import_master' in request.files else ('upsert' if request.form.get('merge_update') else 'merge')
+        try:
+            from master_diff import format_diff_summary
+            with get_db_session(project_name) as dbsession:
+                summary, report = dry_run_master_excel(dbsession, file, mode)
+            g.log_rows = len(report)
+            flash(f"Simulação ({mode}), nada foi gravado: {format_diff_summary(summary)}", f"dryrun:{save_dry_run_report(project_name, report)}")
+        except Exception as e_dry: flash(f"Erro Simulação: {e_dry}", 'error')
+    else: flash("Inválido.", 'error')
+    return redirect(url_for('index', project_name=project_name, tipo_filtrado=request.form.get('tipo_filtrado')))
+
+def _handle_import_bundle(project_name):
+    file = request.files['form_import_bundle']
+    if file.filename.endswith(BUNDLE_EXTENSION):
+        try: import_project_bundle(project_name, file); flash("Pacote importado!", 'success')
+        except Exception as e_imp: flash(f"Erro Import: {e_imp}", 'error')
+    else: flash("Inválido.", 'error')
+    return redirect(url_for('index', project_name=project_name, tipo_filtrado=request.form.get('tipo_filtrado')))
+
 def _handle_index(project_name, dbsession):
     if request.method == 'POST':
         try:
-            if 'form_import_master' in request.files:
-                file = request.files['form_import_master']
-                if file.filename.endswith('.xlsx'):
-                    try: import_master_excel(dbsession, file); flash("Master Data importado!", 'success')
-                    except Exception as e_imp: flash(f"Erro Import: {e_imp}", 'error')
-                else: flash("Inválido.", 'error')
-            elif 'form_merge_master' in request.files:
+            if 'form_merge_master' in request.files:
                 file = request.files['form_merge_master']
-                if file.filename.endswith('.xlsx'):
-                    try: merge_master_excel(dbsession, file); flash("Master Data mesclado!", 'success')
+                if file.filename.lower().endswith(MASTER_UPLOAD_EXTENSIONS):
+                    try:
+                        # v94: Modo com atualização das linhas existentes (UPSERT); v101: corre no escritor, sozinha
+                        from master_ingest import read_master_sheets  # v99: puxa pandas; só carregado na importação
+                        summary = merge_master_sheets(project_name, dbsession, read_master_sheets(file), bool(request.form.get('merge_update')))
+                        if summary is not None: flash(f"Master Data mesclado e atualizado! {format_upsert_summary(summary)}", 'success')
+                        else: flash("Master Data mesclado!", 'success')
                     except Exception as e_merge: flash(f"Erro Merge: {e_merge}", 'error')
                 else: flash("Inválido.", 'error')
             
-            # --- EXPORTAÇÕES COM COOKIE (v85+) ---
-            elif 'form_export_master_excel' in request.form:
-                output_buffer = io.BytesIO(); writer = pd.ExcelWriter(output_buffer, engine='openpyxl')
-                export_master_areas(dbsession).to_excel(writer, 'Areas', index=False); export_master_unidades(dbsession).to_excel(writer, 'Unidades', index=False)
-                export_master_phases(dbsession).to_excel(writer, 'Phases', index=False); export_master_params(dbsession).to_excel(writer, 'Parametros', index=False)
-                export_master_steps(dbsession).to_excel(writer, 'Passos', index=False); export_master_interlocks(dbsession).to_excel(writer, 'Interlocks', index=False)
-                export_master_transitions(dbsession).to_excel(writer, 'Transicoes', index=False)
-                writer.close(); output_buffer.seek(0)
-                resp = make_response(send_file(output_buffer, as_attachment=True, download_name=f"Master_{project_name}.xlsx", mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'))
-                resp.set_cookie('file_downloaded', 'true', path='/'); return resp
-            
-            elif 'form_gerar_csv' in request.form:
-                root = request.form.get('caminho_raiz_steps'); aid = request.form.get('area_filtrada_id'); uid = request.form.get('unidade_filtrada_id'); tipo = request.form.get('tipo_filtrado')
-                q = dbsession.query(Phases).join(Unidades).join(Areas).order_by(Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase).options(joinedload(Phases.unidade).joinedload(Unidades.area))
-                if aid: q=q.filter(Unidades.area_id==int(aid))
-                if uid: q=q.filter(Phases.unidade_id==int(uid))
-                if tipo: q=q.filter(Phases.tipo_phase==tipo)
-                output_buffer = io.StringIO(); w = csv.writer(output_buffer); w.writerow([":TEMPLATE=$NRK100_Procedure"]); w.writerow([":Tagname","Area","SecurityGroup","ContainedName","ShortDesc","HMIText_StepInformation"])
-                for p_arch in q.all():
-                    an = p_arch.unidade.area.nome_area
-                    w.writerow([f"{an}_{p_arch.nome_phase}", f"{an}_{p_arch.unidade.nome_unidade}", "Default", p_arch.nome_phase, p_arch.nome_phase, f"{root.replace(os.sep,'/')}/{p_arch.unidade.nome_unidade}/{an}_{p_arch.nome_phase}.xml"])
-                output_buffer.seek(0)
-                resp = make_response(send_file(io.BytesIO(output_buffer.getvalue().encode('utf-8')), as_attachment=True, download_name=f"{project_name}_Phases_Archestra.csv", mimetype='text/csv'))
+            # --- EXPORTAÇÕES COM COOKIE (v85+; v100: geradas por export_artifact, partilhado com batch_export.py) ---
+            elif any(form_key in request.form for form_key in EXPORT_FORM_ARTIFACTS):
+                artifact = next(EXPORT_FORM_ARTIFACTS[form_key] for form_key in EXPORT_FORM_ARTIFACTS if form_key in request.form)
+                extra = {'steps_root': request.form.get('caminho_raiz_steps')} if artifact == 'phases_csv' else {}
+                file_name, data, count = export_artifact(dbsession, artifact, project_name, request.form.get('area_filtrada_id'), request.form.get('unidade_filtrada_id'), request.form.get('tipo_filtrado'), **extra)
+                g.log_rows = count
+                if not count and artifact == 'transitions_csv': flash("Nada para exportar.", 'error')
+                resp = make_response(send_file(io.BytesIO(data), as_attachment=True, download_name=file_name, mimetype=EXPORT_ARTIFACTS[artifact][2]))
                 resp.set_cookie('file_downloaded', 'true', path='/'); return resp
 
-            elif 'form_gerar_zip' in request.form:
-                aid = request.form.get('area_filtrada_id'); uid = request.form.get('unidade_filtrada_id'); tipo = request.form.get('tipo_filtrado')
-                q = dbsession.query(Phases).options(joinedload(Phases.unidade).joinedload(Unidades.area))
-                if aid: q = q.join(Unidades).filter(Unidades.area_id == int(aid))
-                if uid: q = q.filter(Phases.unidade_id == int(uid))
-                if tipo: q = q.filter(Phases.tipo_phase == tipo)
+            # v96: Pacote binário (todas as tabelas, sem perdas)
+            elif 'form_export_bundle' in request.form:
                 output_buffer = io.BytesIO()
-                with zipfile.ZipFile(output_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                    for pz in q.all(): zf.writestr(f"Steps/{pz.unidade.nome_unidade}/{pz.unidade.area.nome_area}_{pz.nome_phase}.xml", generate_steps_xml(pz))
-                output_buffer.seek(0)
-                resp = make_response(send_file(output_buffer, as_attachment=True, download_name=f"{project_name}_Steps.zip", mimetype='application/zip'))
-                resp.set_cookie('file_downloaded', 'true', path='/'); return resp
-
-            elif 'form_gerar_param_csv' in request.form:
-                aid = request.form.get('area_filtrada_id'); uid = request.form.get('unidade_filtrada_id'); tipo = request.form.get('tipo_filtrado')
-                q = dbsession.query(Parametros).join(Phases).join(Unidades).join(Areas).order_by(Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase, Parametros.numero_param).options(joinedload(Parametros.phase).joinedload(Phases.unidade).joinedload(Unidades.area))
-                if aid: q = q.filter(Unidades.area_id == int(aid))
-                if uid: q = q.filter(Phases.unidade_id == int(uid))
-                if tipo: q = q.filter(Phases.tipo_phase == tipo)
-                output_buffer = io.StringIO(); w = csv.writer(output_buffer); curr = None
-                for pm_arch in q.all():
-                    if pm_arch.tipo_dado != curr:
-                        if curr: w.writerow([])
-                        # v86: Correção de Cabeçalho
-                        w.writerow([f":TEMPLATE=$NRK100_Parameter{'Float' if pm_arch.tipo_dado=='real' else 'Integer' if pm_arch.tipo_dado=='inteiro' else 'Bool'}_GEA"])
-                        w.writerow([":Tagname","Area","SecurityGroup","Container","ContainedName","Description","ShortDesc","EngUnits","HMIText_ParamDescription.1046","HMIText_ParamDescription.1033","HMIText_ParamDescription.3082","AliasName","ExecutionRelativeOrder","ExecutionRelatedObject"]); curr = pm_arch.tipo_dado
-                    d_pt = f"{pm_arch.nome_param}-{pm_arch.descricao_pt or ''}"; d_en = f"{pm_arch.nome_param}-{pm_arch.descricao_en or pm_arch.descricao_pt or ''}"; d_es = f"{pm_arch.nome_param}-{pm_arch.descricao_es or pm_arch.descricao_pt or ''}"
-                    w.writerow([f"{pm_arch.phase.unidade.area.nome_area}_{pm_arch.phase.nome_phase}_{pm_arch.nome_param}", f"{pm_arch.phase.unidade.area.nome_area}_{pm_arch.phase.unidade.nome_unidade}", "Default", f"{pm_arch.phase.unidade.area.nome_area}_{pm_arch.phase.nome_phase}", pm_arch.nome_param, d_pt, d_pt, pm_arch.unidade_engenharia or "", d_pt, d_en, d_es, "None", "", ""])
-                output_buffer.seek(0)
-                resp = make_response(send_file(io.BytesIO(output_buffer.getvalue().encode('utf-8')), as_attachment=True, download_name=f"{project_name}_Params_Archestra.csv", mimetype='text/csv'))
-                resp.set_cookie('file_downloaded', 'true', path='/'); return resp
-
-            elif 'form_gerar_interlock_csv' in request.form:
-                aid = request.form.get('area_filtrada_id'); uid = request.form.get('unidade_filtrada_id'); tipo = request.form.get('tipo_filtrado')
-                q = dbsession.query(Phases).join(Unidades).join(Areas).order_by(Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase).options(joinedload(Phases.unidade).joinedload(Unidades.area), selectinload(Phases.interlocks))
-                if aid: q = q.filter(Unidades.area_id == int(aid))
-                if uid: q = q.filter(Phases.unidade_id == int(uid))
-                if tipo: q = q.filter(Phases.tipo_phase == tipo)
-                output_buffer = io.StringIO(); w = csv.writer(output_buffer)
-                # v86: Correção de Cabeçalho
-                w.writerow([":TEMPLATE=$NRK100_Procedure"]); w.writerow([":Tagname","Area","HMIText_SecureInterlocks.1046","HMIText_SecureInterlocks.1033","HMIText_SecureInterlocks.3082","HMIText_ProcessInterlocks.1046","HMIText_ProcessInterlocks.1033","HMIText_ProcessInterlocks.3082"])
-                for ph_il in q.all():
-                    il_map = {ilk.numero_interlock: ilk for ilk in ph_il.interlocks}; s_pt, s_en, s_es, p_pt, p_en, p_es = [],[],[],[],[],[]
-                    for bit_i in range(32):
-                        iobj = il_map.get(bit_i)
-                        s_pt.append(iobj.seguranca_pt or "" if iobj else ""); s_en.append(iobj.seguranca_en or "" if iobj else ""); s_es.append(iobj.seguranca_es or "" if iobj else "")
-                        p_pt.append(iobj.processo_pt or "" if iobj else ""); p_en.append(iobj.processo_en or "" if iobj else ""); p_es.append(iobj.processo_es or "" if iobj else "")
-                    w.writerow([f"{ph_il.unidade.area.nome_area}_{ph_il.nome_phase}", f"{ph_il.unidade.area.nome_area}_{ph_il.unidade.nome_unidade}", ",".join(s_pt), ",".join(s_en), ",".join(s_es), ",".join(p_pt), ",".join(p_en), ",".join(p_es)])
-                output_buffer.seek(0)
-                resp = make_response(send_file(io.BytesIO(output_buffer.getvalue().encode('utf-8')), as_attachment=True, download_name=f"{project_name}_Interlocks_Archestra.csv", mimetype='text/csv'))
-                resp.set_cookie('file_downloaded', 'true', path='/'); return resp
-
-            # V88: Revertido para método SÍNCRONO (sem streaming) mas com 'selectinload'
-            elif 'form_gerar_transition_csv' in request.form:
-                aid = request.form.get('area_filtrada_id'); uid = request.form.get('unidade_filtrada_id'); tipo = request.form.get('tipo_filtrado')
-                q = dbsession.query(Phases).join(Unidades).join(Areas).order_by(Areas.nome_area, Unidades.nome_unidade, Phases.nome_phase).options(
-                    joinedload(Phases.unidade).joinedload(Unidades.area), 
-                    selectinload(Phases.transition_conditions), 
-                    selectinload(Phases.transition_row_descriptions)
-                )
-                if aid: q = q.filter(Unidades.area_id == int(aid))
-                if uid: q = q.filter(Phases.unidade_id == int(uid))
-                if tipo: q = q.filter(Phases.tipo_phase == tipo)
-                
-                phases = q.all() # Carrega tudo na memória (otimizado pelo selectinload)
-                if not phases: flash("Nada para exportar.", 'error')
-                
-                output_buffer = io.StringIO(); w = csv.writer(output_buffer); w.writerow([":TEMPLATE=$NRK100_Procedure_Transitions_G"])
-                
-                # V89: Loop explícito para cabeçalho
-                h = [":Tagname","Area","SecurityGroup","Container","ContainedName","Description","ShortDesc"]
-                for lc_code_h in ["1033","1046","3082"]:
-                    for bit_idx_h in range(32): h.append(f"HMI_ConditionsDescription_{bit_idx_h:02d}.{lc_code_h}")
-                for lc_code_h in ["1033","1046","3082"]: h.append(f"HMI_TransitionDescription.{lc_code_h}")
-                w.writerow(h)
-                
-                for p in phases:
-                    row = [f"{p.unidade.area.nome_area}_{p.nome_phase}_Tran", f"{p.unidade.area.nome_area}_{p.unidade.nome_unidade}", "Default", f"{p.unidade.area.nome_area}_{p.nome_phase}", "TransitionConditions", "TransitionConditions", "TransitionConditions"]
-                    conds = {}; 
-                    for c in p.transition_conditions:
-                        if c.condition_text_pt:
-                            t_val = c.condition_text_pt.strip()
-                            if c.condition_logic and c.condition_logic != 'N/A': t_val += f" {c.condition_logic}"
-                            conds[(c.step_index, c.condition_row)] = t_val
-                    descs = {d.row_number: d for d in p.transition_row_descriptions}
-                    
-                    # V89: Correção 'lang' -> 'l_code'
-                    for l_code in ['en','pt','es']:
-                        for s_idx in range(32):
-                            lines = []
-                            for r_idx in range(32):
-                                # V89: Correção para buscar o texto traduzido (se existir)
-                                c_obj = conds.get((s_idx, r_idx))
-                                txt_val = ""
-                                if c_obj:
-                                    if l_code == 'en': txt_val = c_obj.condition_text_en
-                                    elif l_code == 'pt': txt_val = c_obj.condition_text_pt
-                                    else: txt_val = c_obj.condition_text_es
-                                    if txt_val and c_obj.condition_logic and c_obj.condition_logic != 'N/A':
-                                        txt_val += f" {c_obj.condition_logic}"
-                                lines.append(txt_val or "")
-                            row.append(",".join(lines))
-                    for l_code in ['en','pt','es']:
-                        descs_vals = []
-                        for r_idx in range(32):
-                            d_obj = descs.get(r_idx)
-                            val = ""
-                            if d_obj:
-                                if l_code=='en': val = d_obj.descricao_en
-                                elif l_code=='pt': val = d_obj.descricao_pt
-                                else: val = d_obj.descricao_es
-                            descs_vals.append(val or "")
-                        row.append(",".join(descs_vals))
-                    w.writerow(row)
-                output_buffer.seek(0)
-                resp = make_response(send_file(io.BytesIO(output_buffer.getvalue().encode('utf-8')), as_attachment=True, download_name=f"{project_name}_Transitions_Archestra.csv", mimetype='text/csv'))
+                write_bundle(dbsession.connection(), Base.metadata, output_buffer, SCHEMA_VERSION, project_name); output_buffer.seek(0)
+                resp = make_response(send_file(output_buffer, as_attachment=True, download_name=f"{os.path.splitext(project_name)[0]}{BUNDLE_EXTENSION}", mimetype='application/zip'))
                 resp.set_cookie('file_downloaded', 'true', path='/'); return resp
 
+            # v92: DELETE direto; o ON DELETE CASCADE do SQLite remove os filhos sem carregá-los no ORM
             elif 'form_remove_area' in request.form:
-                 a = dbsession.get(Areas, request.form.get('area_id'));
-                 if a: dbsession.delete(a); flash("Removido.",'success')
+                 area_id = int(request.form.get('area_id'))
+                 n = run_write(project_name, lambda ds: ds.query(Areas).filter(Areas.area_id == area_id).delete(synchronize_session=False))
+                 if n: flash("Removido.",'success')
             elif 'form_remove_unidade' in request.form:
-                 u = dbsession.get(Unidades, request.form.get('unidade_id'));
-                 if u: dbsession.delete(u); flash("Removido.",'success')
+                 unidade_id = int(request.form.get('unidade_id'))
+                 n = run_write(project_name, lambda ds: ds.query(Unidades).filter(Unidades.unidade_id == unidade_id).delete(synchronize_session=False))
+                 if n: flash("Removido.",'success')
             elif 'form_remove_phase' in request.form:
-                 p = dbsession.get(Phases, request.form.get('phase_id'));
-                 if p: dbsession.delete(p); flash("Removido.",'success')
+                 phase_id = int(request.form.get('phase_id'))
+                 n = run_write(project_name, lambda ds: ds.query(Phases).filter(Phases.phase_id == phase_id).delete(synchronize_session=False))
+                 if n: flash("Removido.",'success')
         except Exception as e:
             logger.error(f"Erro em index POST para {project_name}: {e}")
             flash(f"Erro: {str(e)}", 'error')
@@ -607,7 +1475,8 @@ def _handle_index(project_name, dbsession):
         phases = q_p.all()
         has_more = False
 
-    logger.info(f"Dashboard {project_name}: {len(phases)} phases carregadas (página {page})")
+    g.log_rows = len(phases)
+    logger.info(f"Dashboard {project_name}: {len(phases)} phases carregadas (página {page})", extra={'sample_key': 'dashboard'})
 
     return render_template(
         'index.html',
@@ -620,16 +1489,48 @@ def _handle_index(project_name, dbsession):
         tipo_filtrado=tipo,
         page=page,
         has_more=has_more,
-        total_phases=total_phases
+        total_phases=total_phases,
+        snapshots=get_project_snapshots(project_name)
     )
 
-# --- ROTAS CRUD (INCLUÍDAS) ---
+# --- ROTAS CRUD (INCLUÍDAS; v101: gravações via run_write, leituras via get_db_session) ---
+@app.route('/project/<project_name>/snapshot', methods=['POST'])
+def create_project_snapshot(project_name):
+    try:
+        info = snapshot_project(project_name, request.form.get('snapshot_label'))
+        flash(f"Snapshot {info['name']} criado ({info['bytes'] / 1024 / 1024:.1f} MB, {info['seconds']:.1f}s).", 'success')
+    except Exception as e: flash(f"Erro Snapshot: {e}", 'error')
+    return redirect(url_for('index', project_name=project_name))
+
+@app.route('/project/<project_name>/restore_snapshot', methods=['POST'])
+def restore_snapshot(project_name):
+    try: restore_project_snapshot(project_name, request.form.get('snapshot_name', '')); flash(f"Snapshot {request.form.get('snapshot_name')} reposto!", 'success')
+    except Exception as e: flash(f"Erro Restauro: {e}", 'error')
+    return redirect(url_for('index', project_name=project_name))
+
+@app.route('/project/<project_name>/snapshot_download')
+def download_snapshot(project_name):
+    name = request.args.get('snapshot_name', '')
+    if name not in {s['name'] for s in get_project_snapshots(project_name)}:
+        return "Snapshot inexistente.", 404
+    return send_file(_snapshot_path(project_name, name), as_attachment=True, download_name=f"{os.path.splitext(project_name)[0]}_{os.path.basename(name)}", mimetype='application/gzip')
+
+@app.route('/project/<project_name>/dry_run/<token>.csv')
+def download_dry_run(project_name, token):
+    """Relatório de uma simulação (v103). O token só admite o formato gerado por save_dry_run_report"""
+    if not token.startswith(f"{os.path.splitext(project_name)[0]}_") or not all(c.isalnum() or c in '_-' for c in token):
+        return "Relatório inválido.", 404
+    path = os.path.join(_dry_run_folder(), f"{token}.csv")
+    if not os.path.exists(path):
+        return "Relatório expirado.", 404
+    return send_file(path, as_attachment=True, download_name=f"simulacao_{token}.csv", mimetype='text/csv')
+
 @app.route('/project/<project_name>/add_area', methods=['GET', 'POST'])
 def add_area(project_name):
     if request.method == 'POST':
         try:
-            with get_db_session(project_name) as ds:
-                ds.add(Areas(nome_area=request.form['nome_area']))
+            nome_area = request.form['nome_area']
+            run_write(project_name, lambda ds: ds.add(Areas(nome_area=nome_area)))
             logger.info(f"Área '{request.form['nome_area']}' adicionada ao projeto {project_name}")
             return redirect(url_for('index', project_name=project_name))
         except Exception as e:
@@ -639,192 +1540,263 @@ def add_area(project_name):
 
 @app.route('/project/<project_name>/edit_area/<int:area_id>', methods=['GET', 'POST'])
 def edit_area(project_name, area_id):
+    if request.method == 'POST':
+        try:
+            nome_area = request.form.get('nome_area')
+            def _write(ds): ds.get(Areas, area_id).nome_area = nome_area
+            run_write(project_name, _write)
+            logger.info(f"Área {area_id} editada no projeto {project_name}")
+            return redirect(url_for('index', project_name=project_name))
+        except Exception as e:
+            logger.error(f"Erro ao editar área {area_id} em {project_name}: {e}")
+            flash(f"Erro: {str(e)}", 'error')
     with get_db_session(project_name) as ds:
         a = ds.get(Areas, area_id)
-        if request.method == 'POST':
-            try:
-                a.nome_area = request.form.get('nome_area')
-                logger.info(f"Área {area_id} editada no projeto {project_name}")
-                return redirect(url_for('index', project_name=project_name))
-            except Exception as e:
-                logger.error(f"Erro ao editar área {area_id} em {project_name}: {e}")
-                flash(f"Erro: {str(e)}", 'error')
         return render_template('edit_area.html', area=a, project_name=project_name)
 
 @app.route('/project/<project_name>/add_unidade', methods=['GET', 'POST'])
 def add_unidade(project_name):
+    if request.method == 'POST':
+        try:
+            nome_unidade, area_id = request.form['nome_unidade'], request.form.get('area_id')
+            run_write(project_name, lambda ds: ds.add(Unidades(nome_unidade=nome_unidade, area_id=area_id)))
+            logger.info(f"Unidade '{nome_unidade}' adicionada ao projeto {project_name}")
+            return redirect(url_for('index', project_name=project_name))
+        except Exception as e:
+            logger.error(f"Erro ao adicionar unidade em {project_name}: {e}")
+            flash(f"Erro: {str(e)}", 'error')
     with get_db_session(project_name) as ds:
-        if request.method == 'POST':
-            try:
-                ds.add(Unidades(nome_unidade=request.form['nome_unidade'], area_id=request.form.get('area_id')))
-                logger.info(f"Unidade '{request.form['nome_unidade']}' adicionada ao projeto {project_name}")
-                return redirect(url_for('index', project_name=project_name))
-            except Exception as e:
-                logger.error(f"Erro ao adicionar unidade em {project_name}: {e}")
-                flash(f"Erro: {str(e)}", 'error')
         return render_template('add_unidade.html', todas_areas=ds.query(Areas).all(), project_name=project_name)
 
 @app.route('/project/<project_name>/edit_unidade/<int:unidade_id>', methods=['GET', 'POST'])
 def edit_unidade(project_name, unidade_id):
+    if request.method == 'POST':
+        try:
+            nome_unidade, area_id = request.form.get('nome_unidade'), request.form.get('area_id')
+            def _write(ds):
+                u = ds.get(Unidades, unidade_id)
+                u.nome_unidade = nome_unidade
+                u.area_id = area_id
+            run_write(project_name, _write)
+            logger.info(f"Unidade {unidade_id} editada no projeto {project_name}")
+            return redirect(url_for('index', project_name=project_name))
+        except Exception as e:
+            logger.error(f"Erro ao editar unidade {unidade_id} em {project_name}: {e}")
+            flash(f"Erro: {str(e)}", 'error')
     with get_db_session(project_name) as ds:
         u = ds.get(Unidades, unidade_id)
-        if request.method == 'POST':
-            try:
-                u.nome_unidade = request.form.get('nome_unidade')
-                u.area_id = request.form.get('area_id')
-                logger.info(f"Unidade {unidade_id} editada no projeto {project_name}")
-                return redirect(url_for('index', project_name=project_name))
-            except Exception as e:
-                logger.error(f"Erro ao editar unidade {unidade_id} em {project_name}: {e}")
-                flash(f"Erro: {str(e)}", 'error')
         return render_template('edit_unidade.html', unidade=u, todas_areas=ds.query(Areas).all(), project_name=project_name)
 
 @app.route('/project/<project_name>/add_phase', methods=['GET', 'POST'])
 def add_phase(project_name):
+    if request.method == 'POST':
+        try:
+            values = dict(
+                unidade_id=request.form['unidade_id'],
+                nome_phase=f"{request.form['tipo_phase']}{request.form['nome_phase']}",
+                tipo_phase=request.form['tipo_phase'],
+                descricao_pt=request.form.get('descricao_pt')
+            )
+            run_write(project_name, lambda ds: ds.add(Phases(**values)))
+            logger.info(f"Phase '{request.form['nome_phase']}' adicionada ao projeto {project_name}")
+            return redirect(url_for('index', project_name=project_name))
+        except Exception as e:
+            logger.error(f"Erro ao adicionar phase em {project_name}: {e}")
+            flash(f"Erro: {str(e)}", 'error')
     with get_db_session(project_name) as ds:
-        if request.method == 'POST':
-            try:
-                ds.add(Phases(
-                    unidade_id=request.form['unidade_id'],
-                    nome_phase=f"{request.form['tipo_phase']}{request.form['nome_phase']}",
-                    tipo_phase=request.form['tipo_phase'],
-                    descricao_pt=request.form.get('descricao_pt')
-                ))
-                logger.info(f"Phase '{request.form['nome_phase']}' adicionada ao projeto {project_name}")
-                return redirect(url_for('index', project_name=project_name))
-            except Exception as e:
-                logger.error(f"Erro ao adicionar phase em {project_name}: {e}")
-                flash(f"Erro: {str(e)}", 'error')
         return render_template('add_phase.html', todas_unidades=ds.query(Unidades).options(joinedload(Unidades.area)).all(), project_name=project_name)
 
 @app.route('/project/<project_name>/edit_phase/<int:phase_id>', methods=['GET', 'POST'])
 def edit_phase(project_name, phase_id):
+    if request.method == 'POST':
+        try:
+            tipo = request.form.get('tipo_phase')
+            nome_input = request.form.get('nome_phase')
+            if nome_input.startswith(tipo):
+                nome_input = nome_input[len(tipo):]
+            descricao_pt = request.form.get('descricao_pt')
+            # Traduções resolvidas aqui, fora da thread escritora (podem demorar)
+            values = dict(
+                nome_phase=f"{tipo}{nome_input}",
+                tipo_phase=tipo,
+                unidade_id=request.form.get('unidade_id'),
+                descricao_pt=descricao_pt,
+                descricao_en=request.form.get('descricao_en') or auto_translate(descricao_pt)[0],
+                descricao_es=request.form.get('descricao_es') or auto_translate(descricao_pt)[1]
+            )
+            def _write(ds):
+                p = ds.get(Phases, phase_id)
+                for attr, value in values.items(): setattr(p, attr, value)
+            run_write(project_name, _write)
+            logger.info(f"Phase {phase_id} editada no projeto {project_name}")
+            return redirect(url_for('index', project_name=project_name))
+        except Exception as e:
+            logger.error(f"Erro ao editar phase {phase_id} em {project_name}: {e}")
+            flash(f"Erro: {str(e)}", 'error')
     with get_db_session(project_name) as ds:
         p = ds.get(Phases, phase_id)
-        if request.method == 'POST':
-            try:
-                tipo = request.form.get('tipo_phase')
-                nome_input = request.form.get('nome_phase')
-                if nome_input.startswith(tipo):
-                    nome_input = nome_input[len(tipo):]
-                p.nome_phase = f"{tipo}{nome_input}"
-                p.tipo_phase = tipo
-                p.unidade_id = request.form.get('unidade_id')
-                p.descricao_pt = request.form.get('descricao_pt')
-                p.descricao_en = request.form.get('descricao_en') or auto_translate(p.descricao_pt)[0]
-                p.descricao_es = request.form.get('descricao_es') or auto_translate(p.descricao_pt)[1]
-                logger.info(f"Phase {phase_id} editada no projeto {project_name}")
-                return redirect(url_for('index', project_name=project_name))
-            except Exception as e:
-                logger.error(f"Erro ao editar phase {phase_id} em {project_name}: {e}")
-                flash(f"Erro: {str(e)}", 'error')
         return render_template('edit_phase.html', phase=p, todas_unidades=ds.query(Unidades).options(joinedload(Unidades.area)).all(), project_name=project_name)
 
+# v97: Coleções necessárias para renderizar/salvar cada aba
+PHASE_TAB_LOADERS = {
+    'parametros': [Phases.parametros],
+    'tab-passos': [Phases.passos],
+    'tab-transicoes': [Phases.transition_conditions, Phases.transition_row_descriptions],
+    'tab-interlocks': [Phases.interlocks],
+}
+
 @app.route('/project/<project_name>/phase/<int:phase_id>/', methods=['GET', 'POST'])
 def phase_detail(project_name, phase_id):
+    tab = request.form.get('target_tab', 'parametros') if request.method == 'POST' else request.args.get('tab', 'parametros')
+    if tab not in PHASE_TABS: tab = 'parametros'
+    # v97: Modo leve renderiza só a aba ativa (a grelha 32x32 é sempre montada no cliente); ?full=1 mantém a renderização completa
+    if PHASE_DETAIL_LAZY_TABS and not request.args.get('full'):
+        render_tabs = [t for t in [tab] if t != 'tab-transicoes']
+    else:
+        render_tabs = PHASE_TABS
+    if request.method == 'POST':
+        return _save_phase_detail(project_name, phase_id, tab)  # v101: gravação pelo escritor do projeto
     with get_db_session(project_name) as ds:
-        phase = ds.query(Phases).options(
-            joinedload(Phases.unidade).joinedload(Unidades.area),
-            selectinload(Phases.parametros),
-            selectinload(Phases.passos),
-            selectinload(Phases.transition_conditions),
-            selectinload(Phases.transition_row_descriptions),
-            selectinload(Phases.interlocks)
-        ).get(phase_id)
+        loaders = [selectinload(rel) for t in render_tabs for rel in PHASE_TAB_LOADERS[t]]
+        phase = ds.query(Phases).options(joinedload(Phases.unidade).joinedload(Unidades.area), *loaders).get(phase_id)
         if not phase:
             return "Phase não encontrada", 404
-        tab = request.form.get('target_tab', 'parametros') if request.method == 'POST' else request.args.get('tab', 'parametros')
-        return _handle_phase_detail(project_name, phase_id, ds, phase, tab)
+        return _handle_phase_detail(project_name, phase_id, ds, phase, tab, render_tabs)
 
-def _handle_phase_detail(project_name, phase_id, ds, phase, tab):
+@app.route('/project/<project_name>/phase/<int:phase_id>/data.json')
+def phase_detail_data(project_name, phase_id):
+    """Payload compacto (listas posicionais) para construir as abas no cliente (v97)"""
+    with get_db_session(project_name) as ds:
+        if ds.get(Phases, phase_id) is None:
+            return jsonify({'error': 'Phase não encontrada'}), 404
+        q = lambda *cols: [list(r) for r in ds.execute(select(*cols).where(cols[0].class_.phase_id == phase_id))]
+        payload = {
+            # [param_id, numero, classe, tipo, pt, en, es, default, min, max, un_eng]
+            'parametros': q(Parametros.param_id, Parametros.numero_param, Parametros.classe_param, Parametros.tipo_dado, Parametros.descricao_pt, Parametros.descricao_en, Parametros.descricao_es, Parametros.valor_default, Parametros.valor_min, Parametros.valor_max, Parametros.unidade_engenharia),
+            # [numero, codigo, pt, en, es]
+            'passos': q(Passos.numero_passo, Passos.codigo_passo, Passos.descricao_pt, Passos.descricao_en, Passos.descricao_es),
+            # [row, pt]
+            'trans_rows': q(TransitionRowDescriptions.row_number, TransitionRowDescriptions.descricao_pt),
+            # [step, row, texto_pt, lógica]
+            'trans_conds': q(TransitionConditions.step_index, TransitionConditions.condition_row, TransitionConditions.condition_text_pt, TransitionConditions.condition_logic),
+            # [bit, seg_pt, seg_en, seg_es, proc_pt, proc_en, proc_es]
+            'interlocks': q(Interlocks.numero_interlock, Interlocks.seguranca_pt, Interlocks.seguranca_en, Interlocks.seguranca_es, Interlocks.processo_pt, Interlocks.processo_en, Interlocks.processo_es),
+        }
+        g.log_rows = sum(len(rows) for rows in payload.values())
+        return jsonify(payload)
 
-    if request.method == 'POST':
-        try:
-            if 'form_salvar_parametros' in request.form:
-                for pid in request.form.getlist('param_id'):
-                    p = ds.get(Parametros, pid)
-                    if p and f'delete_param_{pid}' in request.form: ds.delete(p); continue
-                    if p:
-                        p.numero_param = int(request.form.get(f'numero_param_{pid}')); p.classe_param = request.form.get(f'classe_param_{pid}'); p.nome_param = f"{p.classe_param}{int(p.numero_param):03d}"; p.tipo_dado = request.form.get(f'tipo_dado_{pid}')
-                        p.descricao_pt = request.form.get(f'descricao_pt_{pid}'); p.descricao_en = request.form.get(f'descricao_en_{pid}') or auto_translate(p.descricao_pt)[0]; p.descricao_es = request.form.get(f'descricao_es_{pid}') or auto_translate(p.descricao_pt)[1]
-                        p.valor_default = request.form.get(f'valor_default_{pid}'); p.valor_min = request.form.get(f'valor_min_{pid}'); p.valor_max = request.form.get(f'valor_max_{pid}'); p.unidade_engenharia = request.form.get(f'unidade_engenharia_{pid}')
-                        session['last_classe'] = p.classe_param
-                for i_loop, num in enumerate(request.form.getlist('numero_param_new')):
-                    if num:
-                        cls = request.form.getlist('classe_param_new')[i_loop]; d_pt = request.form.getlist('descricao_pt_new')[i_loop]; en, es = auto_translate(d_pt)
-                        ds.add(Parametros(phase_id=phase.phase_id, numero_param=int(num), classe_param=cls, nome_param=f"{cls}{int(num):03d}", tipo_dado=request.form.getlist('tipo_dado_new')[i_loop], descricao_pt=d_pt, descricao_en=en, descricao_es=es, valor_default=request.form.getlist('valor_default_new')[i_loop], valor_min=request.form.getlist('valor_min_new')[i_loop], valor_max=request.form.getlist('valor_max_new')[i_loop], unidade_engenharia=request.form.getlist('unidade_engenharia_new')[i_loop]))
-                ds.commit(); flash("Parâmetros salvos.", 'success')
-            elif 'form_salvar_passos' in request.form:
-                start, end = int(request.form.get('grelha_start')), int(request.form.get('grelha_end'))
-                exist = {p.numero_passo: p for p in phase.passos if start <= p.numero_passo < end}
-                for i_loop in range(start, end):
-                    code, d_pt = request.form.get(f'codigo_passo_{i_loop}'), request.form.get(f'descricao_pt_{i_loop}'); p_obj = exist.get(i_loop)
-                    if not code and not d_pt: 
-                        if p_obj: ds.delete(p_obj)
-                    else:
-                        d_en = request.form.get(f'descricao_en_{i_loop}') or auto_translate(d_pt)[0]; d_es = request.form.get(f'descricao_es_{i_loop}') or auto_translate(d_pt)[1]
-                        if p_obj: p_obj.codigo_passo = code; p_obj.descricao_pt = d_pt; p_obj.descricao_en = d_en; p_obj.descricao_es = d_es
-                        else: ds.add(Passos(phase_id=phase.phase_id, numero_passo=i_loop, codigo_passo=code, descricao_pt=d_pt, descricao_en=d_en, descricao_es=d_es))
-                ds.commit(); flash("Passos salvos.", 'success')
-            elif 'form_salvar_transicoes' in request.form:
-                conds = {(c.step_index, c.condition_row): c for c in phase.transition_conditions}; descs = {d.row_number: d for d in phase.transition_row_descriptions}
-                for r_loop in range(32):
-                    d_pt = request.form.get(f'trans_row_desc_pt_{r_loop}'); d_obj = descs.get(r_loop)
-                    if not d_pt: 
-                        if d_obj: ds.delete(d_obj)
-                    else:
-                        en, es = auto_translate(d_pt)
-                        if d_obj: d_obj.descricao_pt = d_pt; d_obj.descricao_en = en; d_obj.descricao_es = es
-                        else: ds.add(TransitionRowDescriptions(phase_id=phase.phase_id, row_number=r_loop, descricao_pt=d_pt, descricao_en=en, descricao_es=es))
-                    for s_loop in range(32):
-                        txt, log = request.form.get(f'trans_text_pt_{s_loop}_{r_loop}'), request.form.get(f'trans_logic_{s_loop}_{r_loop}')
-                        c_obj = conds.get((s_loop, r_loop))
-                        if not txt and (not log or log=='N/A'): 
-                            if c_obj: ds.delete(c_obj)
-                        else:
-                            en, es = auto_translate(txt)
-                            if c_obj: c_obj.condition_text_pt = txt; c_obj.condition_logic = log; c_obj.condition_text_en = en; c_obj.condition_text_es = es
-                            else: ds.add(TransitionConditions(phase_id=phase.phase_id, step_index=s_loop, condition_row=r_loop, condition_text_pt=txt, condition_logic=log, condition_text_en=en, condition_text_es=es))
-                ds.commit(); flash("Transições salvas.", 'success')
-            elif 'form_salvar_interlocks' in request.form:
-                ils = {i.numero_interlock: i for i in phase.interlocks}
-                for i_loop in range(32):
-                    s_pt, p_pt = request.form.get(f'seguranca_pt_{i_loop}'), request.form.get(f'processo_pt_{i_loop}')
-                    s_en, s_es = request.form.get(f'seguranca_en_{i_loop}'), request.form.get(f'seguranca_es_{i_loop}')
-                    p_en, p_es = request.form.get(f'processo_en_{i_loop}'), request.form.get(f'processo_es_{i_loop}')
-                    il_obj = ils.get(i_loop)
-                    if not s_pt and not p_pt:
-                        if il_obj: ds.delete(il_obj)
-                    else:
-                        s_en_a, s_es_a = auto_translate(s_pt); p_en_a, p_es_a = auto_translate(p_pt)
-                        s_en = s_en or s_en_a; s_es = s_es or s_es_a; p_en = p_en or p_en_a; p_es = p_es or p_es_a
-                        if il_obj: il_obj.seguranca_pt=s_pt; il_obj.seguranca_en=s_en; il_obj.seguranca_es=s_es; il_obj.processo_pt=p_pt; il_obj.processo_en=p_en; il_obj.processo_es=p_es
-                        else: ds.add(Interlocks(phase_id=phase.phase_id, numero_interlock=i_loop, seguranca_pt=s_pt, seguranca_en=s_en, seguranca_es=s_es, processo_pt=p_pt, processo_en=p_en, processo_es=p_es))
-                flash("Interlocks salvos.", 'success')
-                logger.info(f"Interlocks salvos para phase {phase_id}")
-        except Exception as e:
-            logger.error(f"Erro ao salvar dados da phase {phase_id}: {e}")
-            flash(f"Erro: {str(e)}", 'error')
-        return redirect(url_for('phase_detail', project_name=project_name, phase_id=phase_id, tab=tab))
+def _prefetch_translations(form):
+    """v101: Preenche a cache de auto_translate no pedido, para a thread escritora não esperar pela rede"""
+    for key, text in form.items(multi=True):
+        if '_pt' in key and text and text.strip():
+            if not form.get(key.replace('_pt', '_en', 1)) or not form.get(key.replace('_pt', '_es', 1)):
+                auto_translate(text)
+
+def _save_phase_detail(project_name, phase_id, tab):
+    form = request.form.copy()  # a thread escritora não tem acesso ao contexto do pedido
+    try:
+        _prefetch_translations(form)
+        result = run_write(project_name, lambda ds: _apply_phase_save(ds, phase_id, tab, form))
+        if result is None:
+            return "Phase não encontrada", 404
+        message, last_classe = result
+        if last_classe: session['last_classe'] = last_classe
+        if message: flash(message, 'success')
+    except Exception as e:
+        logger.error(f"Erro ao salvar dados da phase {phase_id}: {e}")
+        flash(f"Erro: {str(e)}", 'error')
+    return redirect(url_for('phase_detail', project_name=project_name, phase_id=phase_id, tab=tab))
+
+def _apply_phase_save(ds, phase_id, tab, form):
+    """Grava a aba submetida (corre na thread escritora). Retorna (mensagem, última classe) ou None"""
+    loaders = [selectinload(rel) for rel in PHASE_TAB_LOADERS[tab]]
+    phase = ds.query(Phases).options(*loaders).get(phase_id)
+    if not phase:
+        return None
+    message = last_classe = None
+    if 'form_salvar_parametros' in form:
+        for pid in form.getlist('param_id'):
+            p = ds.get(Parametros, pid)
+            if p and f'delete_param_{pid}' in form: ds.delete(p); continue
+            if p:
+                p.numero_param = int(form.get(f'numero_param_{pid}')); p.classe_param = form.get(f'classe_param_{pid}'); p.nome_param = f"{p.classe_param}{int(p.numero_param):03d}"; p.tipo_dado = form.get(f'tipo_dado_{pid}')
+                p.descricao_pt = form.get(f'descricao_pt_{pid}'); p.descricao_en = form.get(f'descricao_en_{pid}') or auto_translate(p.descricao_pt)[0]; p.descricao_es = form.get(f'descricao_es_{pid}') or auto_translate(p.descricao_pt)[1]
+                p.valor_default = form.get(f'valor_default_{pid}'); p.valor_min = form.get(f'valor_min_{pid}'); p.valor_max = form.get(f'valor_max_{pid}'); p.unidade_engenharia = form.get(f'unidade_engenharia_{pid}')
+                last_classe = p.classe_param
+        for i_loop, num in enumerate(form.getlist('numero_param_new')):
+            if num:
+                cls = form.getlist('classe_param_new')[i_loop]; d_pt = form.getlist('descricao_pt_new')[i_loop]; en, es = auto_translate(d_pt)
+                ds.add(Parametros(phase_id=phase.phase_id, numero_param=int(num), classe_param=cls, nome_param=f"{cls}{int(num):03d}", tipo_dado=form.getlist('tipo_dado_new')[i_loop], descricao_pt=d_pt, descricao_en=en, descricao_es=es, valor_default=form.getlist('valor_default_new')[i_loop], valor_min=form.getlist('valor_min_new')[i_loop], valor_max=form.getlist('valor_max_new')[i_loop], unidade_engenharia=form.getlist('unidade_engenharia_new')[i_loop]))
+        message = "Parâmetros salvos."
+    elif 'form_salvar_passos' in form:
+        start, end = int(form.get('grelha_start')), int(form.get('grelha_end'))
+        exist = {p.numero_passo: p for p in phase.passos if start <= p.numero_passo < end}
+        for i_loop in range(start, end):
+            code, d_pt = form.get(f'codigo_passo_{i_loop}'), form.get(f'descricao_pt_{i_loop}'); p_obj = exist.get(i_loop)
+            if not code and not d_pt: 
+                if p_obj: ds.delete(p_obj)
+            else:
+                d_en = form.get(f'descricao_en_{i_loop}') or auto_translate(d_pt)[0]; d_es = form.get(f'descricao_es_{i_loop}') or auto_translate(d_pt)[1]
+                if p_obj: p_obj.codigo_passo = code; p_obj.descricao_pt = d_pt; p_obj.descricao_en = d_en; p_obj.descricao_es = d_es
+                else: ds.add(Passos(phase_id=phase.phase_id, numero_passo=i_loop, codigo_passo=code, descricao_pt=d_pt, descricao_en=d_en, descricao_es=d_es))
+        message = "Passos salvos."
+    elif 'form_salvar_transicoes' in form:
+        conds = {(c.step_index, c.condition_row): c for c in phase.transition_conditions}; descs = {d.row_number: d for d in phase.transition_row_descriptions}
+        for r_loop in range(32):
+            d_pt = form.get(f'trans_row_desc_pt_{r_loop}'); d_obj = descs.get(r_loop)
+            if not d_pt: 
+                if d_obj: ds.delete(d_obj)
+            else:
+                en, es = auto_translate(d_pt)
+                if d_obj: d_obj.descricao_pt = d_pt; d_obj.descricao_en = en; d_obj.descricao_es = es
+                else: ds.add(TransitionRowDescriptions(phase_id=phase.phase_id, row_number=r_loop, descricao_pt=d_pt, descricao_en=en, descricao_es=es))
+            for s_loop in range(32):
+                txt, log = form.get(f'trans_text_pt_{s_loop}_{r_loop}'), form.get(f'trans_logic_{s_loop}_{r_loop}')
+                c_obj = conds.get((s_loop, r_loop))
+                if not txt and (not log or log=='N/A'): 
+                    if c_obj: ds.delete(c_obj)
+                else:
+                    en, es = auto_translate(txt)
+                    if c_obj: c_obj.condition_text_pt = txt; c_obj.condition_logic = log; c_obj.condition_text_en = en; c_obj.condition_text_es = es
+                    else: ds.add(TransitionConditions(phase_id=phase.phase_id, step_index=s_loop, condition_row=r_loop, condition_text_pt=txt, condition_logic=log, condition_text_en=en, condition_text_es=es))
+        message = "Transições salvas."
+    elif 'form_salvar_interlocks' in form:
+        ils = {i.numero_interlock: i for i in phase.interlocks}
+        for i_loop in range(32):
+            s_pt, p_pt = form.get(f'seguranca_pt_{i_loop}'), form.get(f'processo_pt_{i_loop}')
+            s_en, s_es = form.get(f'seguranca_en_{i_loop}'), form.get(f'seguranca_es_{i_loop}')
+            p_en, p_es = form.get(f'processo_en_{i_loop}'), form.get(f'processo_es_{i_loop}')
+            il_obj = ils.get(i_loop)
+            if not s_pt and not p_pt:
+                if il_obj: ds.delete(il_obj)
+            else:
+                s_en_a, s_es_a = auto_translate(s_pt) if not (s_en and s_es) else ('', ''); p_en_a, p_es_a = auto_translate(p_pt) if not (p_en and p_es) else ('', '')
+                s_en = s_en or s_en_a; s_es = s_es or s_es_a; p_en = p_en or p_en_a; p_es = p_es or p_es_a
+                if il_obj: il_obj.seguranca_pt=s_pt; il_obj.seguranca_en=s_en; il_obj.seguranca_es=s_es; il_obj.processo_pt=p_pt; il_obj.processo_en=p_en; il_obj.processo_es=p_es
+                else: ds.add(Interlocks(phase_id=phase.phase_id, numero_interlock=i_loop, seguranca_pt=s_pt, seguranca_en=s_en, seguranca_es=s_es, processo_pt=p_pt, processo_en=p_en, processo_es=p_es))
+        message = "Interlocks salvos."
+        logger.info(f"Interlocks salvos para phase {phase_id}")
+    return message, last_classe
 
-    # GET request
+def _handle_phase_detail(project_name, phase_id, ds, phase, tab, render_tabs):
+    # GET request (v97: só as abas em render_tabs tocam nas coleções)
     trans_grelha = {}
-    for c in phase.transition_conditions:
-        if c.step_index not in trans_grelha:
-            trans_grelha[c.step_index] = {}
-        trans_grelha[c.step_index][c.condition_row] = c
+    if 'tab-transicoes' in render_tabs:
+        for c in phase.transition_conditions:
+            trans_grelha.setdefault(c.step_index, {})[c.condition_row] = c
 
     return render_template(
         'phase_detail.html',
         project_name=project_name,
         phase=phase,
-        parametros=phase.parametros,
-        passos_dict={p.numero_passo: p for p in phase.passos},
+        parametros=phase.parametros if 'parametros' in render_tabs else [],
+        passos_dict={p.numero_passo: p for p in phase.passos} if 'tab-passos' in render_tabs else {},
         trans_grelha=trans_grelha,
-        trans_row_descs={d.row_number: d for d in phase.transition_row_descriptions},
-        interlocks_dict={i.numero_interlock: i for i in phase.interlocks},
+        trans_row_descs={d.row_number: d for d in phase.transition_row_descriptions} if 'tab-transicoes' in render_tabs else {},
+        interlocks_dict={i.numero_interlock: i for i in phase.interlocks} if 'tab-interlocks' in render_tabs else {},
         last_classe=session.get('last_classe', 'PE'),
-        current_tab=tab
+        current_tab=tab,
+        render_tabs=render_tabs
     )
 
 if __name__ == '__main__':
@@ -0,0 +1,117 @@
+# Versão: v100 (Geração em lote dos artefatos SCADA)
+# Gera, sem interface, os mesmos ficheiros dos botões da página inicial
+# (CSVs ArchestrA, ZIP de Steps, Master Excel) para vários projetos em
+# paralelo, um processo por projeto. Ex. (build noturno):
+#   python batch_export.py --output-dir build/scada --steps-root D:/Steps
+#   python batch_export.py Projeto.db --artifacts steps_zip params_csv --area AREA1 --tipo CIP
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+ARTIFACT_NAMES = ['master_xlsx', 'phases_csv', 'steps_zip', 'params_csv', 'interlocks_csv', 'transitions_csv']
+
+def _resolve_filters(dbsession, area, unidade):
+    """Converte nomes de área/unidade nos ids usados pelas exportações. Retorna None se o projeto não os tiver"""
+    import app
+    aid = uid = None
+    if area:
+        area_obj = dbsession.query(app.Areas).filter(app.Areas.nome_area == area).first()
+        if area_obj is None:
+            return None
+        aid = area_obj.area_id
+    if unidade:
+        q = dbsession.query(app.Unidades).filter(app.Unidades.nome_unidade == unidade)
+        if aid: q = q.filter(app.Unidades.area_id == aid)
+        unidade_obj = q.first()
+        if unidade_obj is None:
+            return None
+        uid = unidade_obj.unidade_id
+    return aid, uid
+
+def export_project(project_name, artifacts, output_dir, area=None, unidade=None, tipo=None, steps_root='', database_folder=None):
+    """Gera os artefatos de um projeto em <output_dir>/<projeto>/ (executa nos processos do pool)"""
+    import app  # import tardio: cada processo do pool abre as suas próprias engines
+    if database_folder:
+        app.DATABASE_FOLDER = database_folder
+    result = {'project': project_name, 'artifacts': {}, 'error': None}
+    started = time.perf_counter()
+    try:
+        project_dir = os.path.join(output_dir, os.path.splitext(project_name)[0])
+        with app.get_db_session(project_name) as dbsession:
+            ids = _resolve_filters(dbsession, area, unidade)
+            if ids is None:
+                result['skipped'] = f"área/unidade inexistente ({area or '-'} / {unidade or '-'})"
+                return result
+            os.makedirs(project_dir, exist_ok=True)
+            for artifact in artifacts:
+                artifact_started = time.perf_counter()
+                extra = {'steps_root': steps_root} if artifact == 'phases_csv' else {}
+                file_name, data, count = app.export_artifact(dbsession, artifact, project_name, ids[0], ids[1], tipo, **extra)
+                with open(os.path.join(project_dir, file_name), 'wb') as f:
+                    f.write(data)
+                result['artifacts'][artifact] = {'file': file_name, 'items': count, 'bytes': len(data), 'seconds': round(time.perf_counter() - artifact_started, 3)}
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    finally:
+        result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+def run_batch(projects, artifacts, output_dir, workers=None, **options):
+    """Exporta os projetos num pool de processos. Retorna a lista de resultados pela ordem dos projetos"""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(projects)))
+    if workers == 1:
+        return [export_project(p, artifacts, output_dir, **options) for p in projects]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_project, p, artifacts, output_dir, **options) for p in projects]
+        return [f.result() for f in futures]
+
+def format_summary(results, elapsed):
+    lines = []
+    for r in results:
+        if r['error']:
+            lines.append(f"ERRO  {r['project']} ({r['seconds']:.2f}s): {r['error']}")
+        elif r.get('skipped'):
+            lines.append(f"SKIP  {r['project']}: {r['skipped']}")
+        else:
+            parts = ", ".join(f"{name} {a['items']} itens/{a['seconds']:.2f}s" for name, a in r['artifacts'].items())
+            lines.append(f"OK    {r['project']} ({r['seconds']:.2f}s): {parts}")
+    failed = sum(1 for r in results if r['error'])
+    lines.append(f"{len(results)} projetos, {failed} com erro, total {elapsed:.2f}s")
+    return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera artefatos SCADA (ArchestrA/Steps/Master) para vários projetos")
+    parser.add_argument('projects', nargs='*', help="Ficheiros de projeto (padrão: todos em DATABASE_FOLDER)")
+    parser.add_argument('--artifacts', nargs='+', choices=ARTIFACT_NAMES, default=ARTIFACT_NAMES)
+    parser.add_argument('--output-dir', default='exports', help="Pasta de destino (uma subpasta por projeto)")
+    parser.add_argument('--area', help="Filtra pelo nome da área")
+    parser.add_argument('--unidade', help="Filtra pelo nome da unidade")
+    parser.add_argument('--tipo', help="Filtra pelo tipo de phase")
+    parser.add_argument('--steps-root', default='', help="Caminho raiz dos XML de Steps (coluna HMIText_StepInformation)")
+    parser.add_argument('--workers', type=int, default=None, help="Processos em paralelo (padrão: nº de CPUs)")
+    parser.add_argument('--database-folder', help="Pasta dos projetos (padrão: a da aplicação)")
+    args = parser.parse_args(argv)
+
+    import app
+    if args.database_folder:
+        app.DATABASE_FOLDER = os.path.abspath(args.database_folder)
+    projects = args.projects or app.list_projects()
+    if not projects:
+        print("Nenhum projeto encontrado.", file=sys.stderr)
+        return 1
+    output_dir = os.path.abspath(args.output_dir)
+    started = time.perf_counter()
+    results = run_batch(projects, args.artifacts, output_dir, args.workers, area=args.area, unidade=args.unidade, tipo=args.tipo,
+                        steps_root=args.steps_root, database_folder=app.DATABASE_FOLDER)
+    elapsed = time.perf_counter() - started
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'batch_summary.json'), 'w', encoding='utf-8') as f:
+        json.dump({'seconds': round(elapsed, 3), 'results': results}, f, ensure_ascii=False, indent=2)
+    print(format_summary(results, elapsed))
+    return 1 if any(r['error'] for r in results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+# Versão: v99 (Benchmark de arranque)
+# Mede o custo de `import app` e da primeira get_engine em processos novos,
+# para que regressões no arranque (imports pesados, schema) fiquem visíveis:
+#   python bench_startup.py --runs 7 --output bench_output.txt
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Corre num interpretador limpo; imprime JSON com tempos e módulos pesados carregados
+_PROBE = r"""
+import sys, time, json
+started = time.perf_counter()
+import app
+import_s = time.perf_counter() - started
+project = sys.argv[1] if len(sys.argv) > 1 else None
+engine_s = None
+if project:
+    started = time.perf_counter()
+    app.get_engine(project)
+    engine_s = time.perf_counter() - started
+heavy = [m for m in ('pandas', 'openpyxl', 'googletrans', 'numpy') if m in sys.modules]
+print(json.dumps({'import_s': import_s, 'engine_s': engine_s, 'heavy': heavy}))
+"""
+
+def _run_probe(project):
+    args = [sys.executable, '-c', _PROBE] + ([project] if project else [])
+    out = subprocess.run(args, cwd=basedir, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def _import_time_top(limit):
+    """Top módulos por tempo cumulativo segundo `python -X importtime`"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=basedir, capture_output=True, text=True, check=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de arranque do NEAT Gestor")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--project', help="Projeto para medir a primeira get_engine (padrão: o primeiro)")
+    parser.add_argument('--top', type=int, default=10, help="Módulos mais lentos a listar")
+    parser.add_argument('--output', help="Grava o relatório também neste ficheiro")
+    args = parser.parse_args(argv)
+
+    project = args.project
+    if project is None:
+        import app
+        projects = app.list_projects()
+        project = projects[0] if projects else None
+
+    results = [_run_probe(project) for _ in range(args.runs)]
+    lines = [f"import app: mediana {statistics.median(r['import_s'] for r in results) * 1000:.0f} ms "
+             f"(min {min(r['import_s'] for r in results) * 1000:.0f} ms, {args.runs} execuções)"]
+    if project:
+        lines.append(f"primeira get_engine({project}): mediana {statistics.median(r['engine_s'] for r in results) * 1000:.1f} ms")
+    lines.append(f"módulos pesados carregados no import: {results[-1]['heavy'] or 'nenhum'}")
+    lines.append("top -X importtime (cumulativo, us):")
+    lines += [f"  {us:>9}  {name}" for us, name in _import_time_top(args.top)]
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + "\n")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,16 +10,16 @@ class Areas(Base):
     area_id = Column(Integer, primary_key=True)
     nome_area = Column(String, nullable=False, unique=True)
     descricao = Column(String)
-    unidades = relationship('Unidades', back_populates='area', cascade="all, delete-orphan")
+    unidades = relationship('Unidades', back_populates='area', cascade="all, delete-orphan", passive_deletes=True)
 
 class Unidades(Base):
     __tablename__ = 'unidades'
     unidade_id = Column(Integer, primary_key=True)
     nome_unidade = Column(String, nullable=False, unique=True)
     descricao = Column(String)
-    area_id = Column(Integer, ForeignKey('areas.area_id'), nullable=False)
+    area_id = Column(Integer, ForeignKey('areas.area_id', ondelete='CASCADE'), nullable=False)
     area = relationship('Areas', back_populates='unidades')
-    phases = relationship('Phases', back_populates='unidade', cascade="all, delete-orphan")
+    phases = relationship('Phases', back_populates='unidade', cascade="all, delete-orphan", passive_deletes=True)
 
 class Phases(Base):
     __tablename__ = 'phases'
@@ -29,20 +29,20 @@ class Phases(Base):
     descricao_pt = Column(String)
     descricao_en = Column(String)
     descricao_es = Column(String)
-    unidade_id = Column(Integer, ForeignKey('unidades.unidade_id'), nullable=False)
+    unidade_id = Column(Integer, ForeignKey('unidades.unidade_id', ondelete='CASCADE'), nullable=False)
     unidade = relationship('Unidades', back_populates='phases')
-    parametros = relationship('Parametros', backref='phase', cascade="all, delete-orphan")
-    passos = relationship('Passos', backref='phase', cascade="all, delete-orphan")
+    parametros = relationship('Parametros', backref='phase', cascade="all, delete-orphan", passive_deletes=True)
+    passos = relationship('Passos', backref='phase', cascade="all, delete-orphan", passive_deletes=True)
     # v68: Transições ligadas diretamente à Phase
-    transition_conditions = relationship('TransitionConditions', backref='phase', cascade="all, delete-orphan")
-    transition_row_descriptions = relationship('TransitionRowDescriptions', backref='phase', cascade="all, delete-orphan")
-    interlocks = relationship('Interlocks', backref='phase', cascade="all, delete-orphan")
+    transition_conditions = relationship('TransitionConditions', backref='phase', cascade="all, delete-orphan", passive_deletes=True)
+    transition_row_descriptions = relationship('TransitionRowDescriptions', backref='phase', cascade="all, delete-orphan", passive_deletes=True)
+    interlocks = relationship('Interlocks', backref='phase', cascade="all, delete-orphan", passive_deletes=True)
     __table_args__ = (UniqueConstraint('unidade_id', 'nome_phase'),)
 
 class Parametros(Base):
     __tablename__ = 'parametros'
     param_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     numero_param = Column(Integer, nullable=False)
     nome_param = Column(String, nullable=False)
     classe_param = Column(String, nullable=False)
@@ -59,7 +59,7 @@ class Parametros(Base):
 class Passos(Base):
     __tablename__ = 'passos'
     passo_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     numero_passo = Column(Integer, nullable=False)
     codigo_passo = Column(String)
     descricao_pt = Column(String)
@@ -71,7 +71,7 @@ class TransitionConditions(Base):
     __tablename__ = 'TransitionConditions'
     condition_id = Column(Integer, primary_key=True)
     # v68: Nova estrutura desacoplada
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     step_index = Column(Integer, nullable=False)
     condition_row = Column(Integer, nullable=False)
     condition_logic = Column(String)
@@ -83,7 +83,7 @@ class TransitionConditions(Base):
 class TransitionRowDescriptions(Base):
     __tablename__ = 'TransitionRowDescriptions'
     row_desc_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     row_number = Column(Integer, nullable=False)
     descricao_pt = Column(String)
     descricao_en = Column(String)
@@ -93,7 +93,7 @@ class TransitionRowDescriptions(Base):
 class Interlocks(Base):
     __tablename__ = 'interlocks'
     interlock_id = Column(Integer, primary_key=True)
-    phase_id = Column(Integer, ForeignKey('phases.phase_id'), nullable=False)
+    phase_id = Column(Integer, ForeignKey('phases.phase_id', ondelete='CASCADE'), nullable=False)
     numero_interlock = Column(Integer, nullable=False)
     seguranca_pt = Column(String)
     seguranca_en = Column(String)
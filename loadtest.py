@@ -0,0 +1,58 @@
+# Versão: v98 (Teste de carga local)
+# Mede requests/s contra um servidor já a correr, ex.:
+#   python serve.py --workers 4 --threads 8
+#   python loadtest.py http://127.0.0.1:5000/project/Projeto.db/ --concurrency 32 --duration 10
+import sys
+import time
+import argparse
+import threading
+import urllib.request
+from collections import Counter
+
+def _worker(url, deadline, results, lock):
+    local = Counter()
+    latencies = []
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url, timeout=30) as resp:
+                resp.read()
+                local[resp.status] += 1
+        except Exception as e:
+            local[type(e).__name__] += 1
+        latencies.append(time.perf_counter() - started)
+    with lock:
+        results['status'].update(local)
+        results['latencies'].extend(latencies)
+
+def run(url, concurrency, duration):
+    results = {'status': Counter(), 'latencies': []}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=_worker, args=(url, deadline, results, lock)) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+    lat = sorted(results['latencies']) or [0]
+    total = sum(results['status'].values())
+    return {
+        'requests': total,
+        'rps': total / elapsed,
+        'p50_ms': lat[len(lat) // 2] * 1000,
+        'p95_ms': lat[int(len(lat) * 0.95) - 1 if len(lat) > 1 else 0] * 1000,
+        'status': dict(results['status']),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga simples (requests/s)")
+    parser.add_argument('url')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args(argv)
+    r = run(args.url, args.concurrency, args.duration)
+    print(f"{r['requests']} requests em {args.duration:.0f}s: {r['rps']:.1f} req/s, p50 {r['p50_ms']:.1f} ms, p95 {r['p95_ms']:.1f} ms, status {r['status']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
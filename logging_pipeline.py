@@ -0,0 +1,190 @@
+# Versão: v105 (Logging assíncrono e estruturado)
+# Os pedidos só colocam o registo numa fila (QueueHandler); uma thread
+# (QueueListener) escreve no ficheiro, em JSON por linha, e na consola.
+# O ficheiro roda por tamanho ou idade e as cópias antigas ficam em .gz.
+# v105: Um escritor por ficheiro (a rotação não é segura com vários): os workers
+# de serve.py escrevem em <log>.w<N>.log, reutilizado a cada arranque; os outros
+# processos filhos (pool do batch_export) só escrevem na consola.
+import os
+import json
+import zlib
+import gzip
+import time
+import queue
+import atexit
+import shutil
+import logging
+import itertools
+import multiprocessing
+import logging.handlers
+from datetime import datetime
+
+# Campos de contexto copiados do registo para a linha JSON (quando presentes)
+CONTEXT_FIELDS = ('request_id', 'project', 'route', 'method', 'status', 'duration_ms', 'rows')
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class JsonLineFormatter(logging.Formatter):
+    """Uma linha JSON por registo: ts, level, logger, msg + campos de contexto"""
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Roda ao passar `max_bytes` ou `max_age_seconds` e comprime as cópias (<log>.1.gz, <log>.2.gz, ...)
+
+    Só um processo pode escrever em cada ficheiro: a rotação renomeia e apaga o
+    ficheiro atual, e as linhas que outro processo ainda lá escrevesse perdiam-se.
+    Por isso cada worker de serve.py tem o seu ficheiro (ver use_worker_log_file).
+    """
+    def __init__(self, filename, max_bytes, backup_count, max_age_seconds=None, encoding='utf-8'):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        self.max_age_seconds = max_age_seconds
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = _gzip_rotator
+        # Um ficheiro sem escritas há mais de max_age roda logo na primeira linha
+        try: self.opened_at = os.stat(self.baseFilename).st_mtime
+        except OSError: self.opened_at = time.time()
+
+    def shouldRollover(self, record):
+        if self.max_age_seconds and time.time() - self.opened_at >= self.max_age_seconds and os.path.exists(self.baseFilename):
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.opened_at = time.time()
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar 1 em cada N registos marcados com `sample_key` (avisos e erros passam sempre).
+
+    Com `request_id` a decisão é por pedido (todas as linhas de um pedido
+    amostrado ficam); sem ele, por contador.
+    """
+    def __init__(self, rates):
+        super().__init__()
+        self.every = {key: max(1, round(1 / rate)) for key, rate in rates.items() if rate > 0}
+        self.disabled = {key for key, rate in rates.items() if rate <= 0}
+        self.counters = {key: itertools.count() for key in self.every}
+
+    def filter(self, record):
+        key = getattr(record, 'sample_key', None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+        if key in self.disabled:
+            return False
+        if key not in self.every:
+            return True
+        request_id = getattr(record, 'request_id', None)
+        if request_id:
+            return zlib.crc32(request_id.encode()) % self.every[key] == 0
+        return next(self.counters[key]) % self.every[key] == 0
+
+class _FastQueueHandler(logging.handlers.QueueHandler):
+    """Só resolve a mensagem e o traceback na thread do pedido; a formatação fica para o listener"""
+    def prepare(self, record):
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None  # frames não devem atravessar a fila
+        return record
+
+_exc_formatter = logging.Formatter()
+
+class ContextFilter(logging.Filter):
+    """Acrescenta ao registo os campos devolvidos por `context_fn()` (executa na thread que registou)"""
+    def __init__(self, context_fn):
+        super().__init__()
+        self.context_fn = context_fn
+
+    def filter(self, record):
+        for field, value in (self.context_fn() or {}).items():
+            if getattr(record, field, None) is None:
+                setattr(record, field, value)
+        return True
+
+_listener = None
+_queue_handler = None
+_file_handler = None
+
+def setup_logging(log_file, max_bytes=10 * 1024 * 1024, backup_count=10, max_age_seconds=None, sample_rates=None, context_fn=None, level=logging.INFO):
+    """Configura o logger raiz: QueueHandler no processo, escrita numa thread. Idempotente"""
+    global _listener, _queue_handler, _file_handler
+    if _listener is not None:
+        return _listener
+    # Abre o ficheiro só na primeira escrita (delay=True); nos filhos serve de modelo a use_worker_log_file
+    file_handler = _file_handler = CompressingRotatingFileHandler(log_file, max_bytes, backup_count, max_age_seconds)
+    file_handler.setFormatter(JsonLineFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _queue_handler = _FastQueueHandler(log_queue)
+    # Filtros correm na thread do pedido: o contexto do Flask só existe aí (contexto antes da amostragem)
+    if context_fn is not None:
+        queue_handler.addFilter(ContextFilter(context_fn))
+    queue_handler.addFilter(SamplingFilter(sample_rates or {}))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    # v105: Filho do multiprocessing sem fork (spawn) volta a importar a app: não escreve no ficheiro do pai
+    handlers = (file_handler, console_handler) if multiprocessing.parent_process() is None else (console_handler,)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    if hasattr(os, 'register_at_fork'):
+        # A thread do listener não sobrevive ao fork: o filho arranca a sua (mesmos handlers)
+        os.register_at_fork(after_in_child=_restart_listener_in_child)
+    return _listener
+
+def worker_log_file(log_file, index):
+    """Ficheiro de log do worker `index` de serve.py: neat_gestor.log -> neat_gestor.w0.log"""
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.w{index}{ext}"
+
+def use_worker_log_file(index):
+    """Worker de longa duração: passa a escrever no seu próprio ficheiro (mesmo nome a cada arranque)"""
+    if _listener is None:
+        return None
+    handler = CompressingRotatingFileHandler(worker_log_file(_file_handler.baseFilename, index), _file_handler.maxBytes,
+                                             _file_handler.backupCount, _file_handler.max_age_seconds)
+    handler.setFormatter(_file_handler.formatter)
+    _listener.handlers = _listener.handlers + (handler,)
+    return handler.baseFilename
+
+def _restart_listener_in_child():
+    if _listener is not None:
+        # Fila nova: a do pai pode ter ficado com o lock preso no momento do fork
+        _listener.queue = _queue_handler.queue = queue.SimpleQueue()
+        # v105: O filho não escreve no ficheiro do pai (a rotação de um apagaria as linhas do outro);
+        # fica com a consola, e os workers de serve.py acrescentam o seu ficheiro com use_worker_log_file
+        _listener.handlers = tuple(h for h in _listener.handlers if h is not _file_handler)
+        _listener._thread = None
+        _listener.start()
+
+def stop_logging():
+    """Esvazia a fila e para o listener (chamado no atexit e antes do os._exit dos workers)"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
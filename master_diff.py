@@ -0,0 +1,213 @@
+# Versão: v103 (Simulação da importação do Master)
+# Compara a planilha com o projeto sem gravar nada: as folhas e as chaves da BD
+# vão para DataFrames e cada tabela é resolvida com um merge (outer + indicator),
+# sem ORM linha a linha e sem traduções. Módulo leve (só pandas), como master_ingest.
+import io
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 'import' = Substituir BD; 'merge' = Mesclar (só adiciona); 'upsert' = Mesclar com atualização
+DRY_RUN_MODES = ('import', 'merge', 'upsert')
+REPORT_COLUMNS = ['tabela', 'estado', 'chave', 'detalhe']
+
+PHASE_KEY = ['Area', 'Unidade', 'Phase']
+_PHASE_JOIN = ("JOIN phases p ON p.phase_id = t.phase_id JOIN unidades u ON u.unidade_id = p.unidade_id "
+               "JOIN areas a ON a.area_id = u.area_id")
+_PHASE_COLS = 'a.nome_area AS "Area", u.nome_unidade AS "Unidade", p.nome_phase AS "Phase"'
+
+# Uma entrada por tabela, pela ordem da importação (os pais antes dos filhos). Os nomes
+# das tabelas são os do resumo do upsert. `optional`: EN/ES só contam quando a planilha os
+# traz (vazios são traduzidos/mantidos na importação); `parent`: (tabela, {coluna: coluna-chave do pai}).
+DIFF_TABLES = [
+    {'table': 'areas', 'sheet': 'Areas', 'keys': ['Nome_Area'], 'values': ['Descricao_Area'],
+     'sql': 'SELECT nome_area AS "Nome_Area", descricao AS "Descricao_Area" FROM areas'},
+    {'table': 'unidades', 'sheet': 'Unidades', 'keys': ['Nome_Unidade'], 'values': ['Area', 'Descricao_Unidade'],
+     'parent': ('areas', {'Area': 'Nome_Area'}),
+     'sql': 'SELECT a.nome_area AS "Area", t.nome_unidade AS "Nome_Unidade", t.descricao AS "Descricao_Unidade" FROM unidades t JOIN areas a ON a.area_id = t.area_id'},
+    {'table': 'phases', 'sheet': 'Phases', 'keys': PHASE_KEY, 'values': ['Tipo', 'Desc_PT'], 'optional': ['Desc_EN', 'Desc_ES'],
+     'defaults': {'Tipo': 'PH'}, 'parent': ('unidades', {'Area': 'Area', 'Unidade': 'Nome_Unidade'}),
+     'sql': 'SELECT a.nome_area AS "Area", u.nome_unidade AS "Unidade", t.nome_phase AS "Phase", t.tipo_phase AS "Tipo", t.descricao_pt AS "Desc_PT", t.descricao_en AS "Desc_EN", t.descricao_es AS "Desc_ES" '
+            'FROM phases t JOIN unidades u ON u.unidade_id = t.unidade_id JOIN areas a ON a.area_id = u.area_id'},
+    {'table': 'parametros', 'sheet': 'Parametros', 'keys': PHASE_KEY + ['Classe', 'Numero'], 'int_keys': ['Numero'],
+     'values': ['Tipo', 'Desc_PT', 'Default', 'Min', 'Max', 'Unidade_Eng'], 'optional': ['Desc_EN', 'Desc_ES'], 'parent': ('phases', None),
+     'sql': f'SELECT {_PHASE_COLS}, t.classe_param AS "Classe", t.numero_param AS "Numero", t.tipo_dado AS "Tipo", t.descricao_pt AS "Desc_PT", t.descricao_en AS "Desc_EN", t.descricao_es AS "Desc_ES", '
+            f't.valor_default AS "Default", t.valor_min AS "Min", t.valor_max AS "Max", t.unidade_engenharia AS "Unidade_Eng" FROM parametros t {_PHASE_JOIN}'},
+    {'table': 'passos', 'sheet': 'Passos', 'keys': PHASE_KEY + ['Index'], 'int_keys': ['Index'],
+     'values': ['Step_Number', 'Desc_PT'], 'optional': ['Desc_EN', 'Desc_ES'], 'parent': ('phases', None),
+     'sql': f'SELECT {_PHASE_COLS}, t.numero_passo AS "Index", t.codigo_passo AS "Step_Number", t.descricao_pt AS "Desc_PT", t.descricao_en AS "Desc_EN", t.descricao_es AS "Desc_ES" FROM passos t {_PHASE_JOIN}'},
+    {'table': 'interlocks', 'sheet': 'Interlocks', 'keys': PHASE_KEY + ['Bit'], 'int_keys': ['Bit'],
+     'values': ['Seg_PT', 'Proc_PT'], 'optional': ['Seg_EN', 'Seg_ES', 'Proc_EN', 'Proc_ES'], 'parent': ('phases', None),
+     'blank_new': ['Seg_PT', 'Proc_PT'],  # o upsert ignora bits novos sem texto
+     'sql': f'SELECT {_PHASE_COLS}, t.numero_interlock AS "Bit", t.seguranca_pt AS "Seg_PT", t.seguranca_en AS "Seg_EN", t.seguranca_es AS "Seg_ES", '
+            f't.processo_pt AS "Proc_PT", t.processo_en AS "Proc_EN", t.processo_es AS "Proc_ES" FROM interlocks t {_PHASE_JOIN}'},
+    {'table': 'TransitionRowDescriptions', 'sheet': 'Transicoes', 'keys': PHASE_KEY + ['Bit_Linha'], 'int_keys': ['Bit_Linha'],
+     'values': ['Desc_Linha_PT'], 'optional': ['Desc_Linha_EN', 'Desc_Linha_ES'], 'parent': ('phases', None),
+     'sql': f'SELECT {_PHASE_COLS}, t.row_number AS "Bit_Linha", t.descricao_pt AS "Desc_Linha_PT", t.descricao_en AS "Desc_Linha_EN", t.descricao_es AS "Desc_Linha_ES" FROM "TransitionRowDescriptions" t {_PHASE_JOIN}'},
+    # Célula Step_N da folha Transicoes = texto PT + ' AND'/' OR' (como na exportação)
+    {'table': 'TransitionConditions', 'sheet': 'Transicoes', 'keys': PHASE_KEY + ['Bit_Linha', 'Step'], 'int_keys': ['Bit_Linha', 'Step'],
+     'values': ['Texto'], 'parent': ('phases', None),
+     'sql': f'SELECT {_PHASE_COLS}, t.condition_row AS "Bit_Linha", t.step_index AS "Step", '
+            f'TRIM(t.condition_text_pt) || CASE WHEN t.condition_logic IN (\'AND\', \'OR\') THEN \' \' || t.condition_logic ELSE \'\' END AS "Texto" '
+            f'FROM "TransitionConditions" t {_PHASE_JOIN} WHERE TRIM(COALESCE(t.condition_text_pt, \'\')) != \'\''},
+]
+
+def _norm(series):
+    """Equivalente vetorizado de _xl_str: vazio -> '', 1.0 -> '1', sem espaços nas pontas"""
+    text = series.astype(object).where(series.notna(), '').astype(str).str.strip()
+    floats = text.str.endswith('.0')  # regex só nas células que podem ser floats inteiros
+    if floats.any():
+        text = text.mask(floats, text[floats].str.replace(r'^(-?\d+)\.0$', r'\1', regex=True))
+    return text
+
+def _key_text(df, keys):
+    text = df[keys[0]]
+    for col in keys[1:]:
+        text = text + ' / ' + df[col]
+    return text
+
+def _differs(db_col, xl_col):
+    """Diferente como em _same_value: texto igual ou números iguais a menos do arredondamento contam como iguais"""
+    diff = db_col.to_numpy() != xl_col.to_numpy()
+    if diff.any():
+        a, b = pd.to_numeric(db_col, errors='coerce').to_numpy(), pd.to_numeric(xl_col, errors='coerce').to_numpy()
+        both = ~np.isnan(a) & ~np.isnan(b)
+        close = np.zeros(len(diff), dtype=bool)
+        close[both] = np.isclose(a[both], b[both], rtol=1e-12, atol=0)
+        diff &= ~close
+    return diff
+
+def _transition_frames(df):
+    """Folha Transicoes -> descrições por linha e condições em formato longo (uma por Step_N preenchido)"""
+    df = df.copy()
+    for col in PHASE_KEY + ['Bit_Linha', 'Desc_Linha_PT', 'Desc_Linha_EN', 'Desc_Linha_ES']:
+        df[col] = _norm(df[col]) if col in df.columns else ''
+    descs = df[(df['Desc_Linha_PT'] != '') | (df['Desc_Linha_EN'] != '') | (df['Desc_Linha_ES'] != '')]
+    step_cols = [f'Step_{i}' for i in range(32) if f'Step_{i}' in df.columns]
+    conds = df[PHASE_KEY + ['Bit_Linha'] + step_cols].melt(id_vars=PHASE_KEY + ['Bit_Linha'], var_name='Step', value_name='Texto')
+    conds = conds[conds['Texto'].to_numpy() != ''].copy()  # a maioria das células Step_N está vazia
+    conds['Texto'] = _norm(conds['Texto'])
+    conds = conds[conds['Texto'] != '']
+    conds['Texto'] = conds['Texto'].str.replace(r'\s+(AND|OR)$', r' \1', regex=True)
+    conds['Step'] = conds['Step'].str.slice(5)
+    return descs, conds
+
+def load_current(connection):
+    """Estado atual do projeto, uma DataFrame por tabela com as colunas da planilha (texto normalizado)"""
+    current = {}
+    for spec in DIFF_TABLES:
+        result = connection.exec_driver_sql(spec['sql'])
+        df = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+        current[spec['table']] = df.apply(_norm) if len(df) else df.astype(str)
+    return current
+
+def _sheet_frame(spec, sheets, transitions):
+    if spec['sheet'] == 'Transicoes':
+        df = transitions[0] if spec['table'] == 'TransitionRowDescriptions' else transitions[1]
+    else:
+        df = sheets[spec['sheet']]
+    cols = spec['keys'] + spec['values'] + spec.get('optional', [])
+    out = pd.DataFrame({col: _norm(df[col]) if col in df.columns else pd.Series('', index=df.index) for col in cols})
+    for col, default in spec.get('defaults', {}).items():
+        out[col] = out[col].mask(out[col] == '', default)
+    return out
+
+def _invalid_rows(spec, xl, parents):
+    """Motivo de rejeição por linha ('' = válida): chave vazia/não inteira, pai inexistente, chave repetida"""
+    reason = pd.Series('', index=xl.index)
+    reason = reason.mask((xl[spec['keys']] == '').any(axis=1), 'chave vazia')
+    for col in spec.get('int_keys', []):
+        num = pd.to_numeric(xl[col], errors='coerce')
+        bad = num.isna() | (num % 1 != 0)
+        reason = reason.mask((reason == '') & bad & (xl[col] != ''), f'{col} não inteiro')
+        xl.loc[~bad, col] = num[~bad].astype('int64').astype(str)
+    if 'parent' in spec:
+        table, mapping = spec['parent']
+        mapping = mapping or {c: c for c in PHASE_KEY}
+        known = parents[table][list(mapping.values())].drop_duplicates().set_axis(list(mapping), axis=1)
+        found = xl[list(mapping)].merge(known, how='left', indicator=True)['_merge'].to_numpy() == 'both'
+        reason = reason.mask((reason == '') & ~found, f'{table} inexistente')
+    reason = reason.mask((reason == '') & xl.duplicated(spec['keys']), 'chave repetida')
+    return reason
+
+def _resulting_keys(mode, keys, db, valid, added):
+    """Linhas que existirão depois da operação (servem de pais às tabelas seguintes)"""
+    if mode == 'import':
+        return valid
+    if mode == 'merge':
+        return pd.concat([db, added], ignore_index=True)
+    kept = db.merge(valid[keys], on=keys, how='left', indicator=True)
+    return pd.concat([db[kept['_merge'].to_numpy() == 'left_only'], valid], ignore_index=True)
+
+def diff_table(spec, xl, db, mode, parents):
+    """Compara uma tabela. Retorna (resumo, linhas do relatório, linhas resultantes)"""
+    keys, compared, optional = spec['keys'], spec['values'], spec.get('optional', [])
+    reason = _invalid_rows(spec, xl, parents)
+    invalid = xl[reason != '']
+    valid = xl[reason == '']
+    merged = valid.merge(db, on=keys, how='outer', suffixes=('', '_db'), indicator=True)
+    added = merged[merged['_merge'] == 'left_only']
+    if mode == 'upsert' and spec.get('blank_new'):
+        added = added[(added[spec['blank_new']] != '').any(axis=1)]
+    removed = merged[merged['_merge'] == 'right_only'] if mode == 'import' else merged.iloc[0:0]
+    both = merged[merged['_merge'] == 'both']
+    diffs = {col: _differs(both[f'{col}_db'], both[col]) for col in compared}
+    diffs.update({col: _differs(both[f'{col}_db'], both[col]) & (both[col] != '').to_numpy() for col in optional})
+    changed_mask = np.logical_or.reduce(list(diffs.values())) if diffs else np.zeros(len(both), dtype=bool)
+    changed = both[changed_mask]
+
+    report = []
+    if len(added):
+        report.append(pd.DataFrame({'estado': 'novo', 'chave': _key_text(added, keys), 'detalhe': ''}))
+    if len(changed):
+        parts = pd.DataFrame({col: np.where(mask[changed_mask], col + ': ' + changed[f'{col}_db'] + ' -> ' + changed[col], '') for col, mask in diffs.items()}, index=changed.index)
+        detail = parts.apply(lambda row: '; '.join(v for v in row if v), axis=1)
+        report.append(pd.DataFrame({'estado': 'alterado' if mode != 'merge' else 'alterado (ignorado)', 'chave': _key_text(changed, keys), 'detalhe': detail}))
+    if len(removed):
+        report.append(pd.DataFrame({'estado': 'removido', 'chave': _key_text(removed, keys), 'detalhe': ''}))
+    if len(invalid):
+        report.append(pd.DataFrame({'estado': 'inválido', 'chave': _key_text(invalid, keys), 'detalhe': reason[reason != '']}))
+    report = pd.concat(report, ignore_index=True) if report else pd.DataFrame(columns=REPORT_COLUMNS[1:])
+    report.insert(0, 'tabela', spec['table'])
+
+    summary = {'added': len(added), 'changed': len(changed), 'removed': len(removed), 'unchanged': len(both) - len(changed), 'invalid': len(invalid)}
+    result_cols = keys + compared
+    return summary, report, _resulting_keys(mode, keys, db[result_cols], valid[result_cols], added[result_cols])
+
+def diff_master(sheets, current, mode='import'):
+    """Simula a importação (`mode` em DRY_RUN_MODES) das folhas lidas por read_master_sheets.
+
+    `current` vem de load_current. Retorna ({tabela: {'added', 'changed',
+    'removed', 'unchanged', 'invalid'}}, DataFrame do relatório). Folhas ausentes
+    são ignoradas (na substituição, as tabelas correspondentes ficam vazias).
+    """
+    if mode not in DRY_RUN_MODES:
+        raise ValueError(f"Modo de simulação desconhecido: {mode}")
+    transitions = _transition_frames(sheets['Transicoes']) if 'Transicoes' in sheets else None
+    summary, reports, parents = {}, [], {}
+    for spec in DIFF_TABLES:
+        db = current[spec['table']]
+        if spec['sheet'] not in sheets:
+            # Substituir apaga tudo, mesmo sem a folha; mesclar mantém o que existe
+            xl = pd.DataFrame(columns=db.columns, dtype=str) if mode == 'import' else None
+            if xl is None:
+                parents[spec['table']] = db
+                continue
+        else:
+            xl = _sheet_frame(spec, sheets, transitions)
+        summary[spec['table']], report, parents[spec['table']] = diff_table(spec, xl, db, mode, parents)
+        reports.append(report)
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=REPORT_COLUMNS)
+    logger.info(f"Simulação ({mode}): {summary}")
+    return summary, report
+
+def format_diff_summary(summary):
+    return "; ".join(f"{t}: +{s['added']} ~{s['changed']} -{s['removed']} ={s['unchanged']} !{s['invalid']}" for t, s in summary.items())
+
+def report_csv(report):
+    """Relatório em CSV (UTF-8 com BOM, para abrir diretamente no Excel)"""
+    out = io.StringIO()
+    report.to_csv(out, index=False)
+    return out.getvalue().encode('utf-8-sig')
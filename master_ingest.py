@@ -0,0 +1,114 @@
+# Versão: v105 (Leitura do Master Excel / CSV numa só passagem)
+# Módulo leve (só pandas/openpyxl), importado só quando há leitura do Master
+import os
+import io
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MASTER_SHEETS = ['Areas', 'Unidades', 'Phases', 'Parametros', 'Passos', 'Interlocks', 'Transicoes']
+# Colunas-chave convertidas para inteiro quando não têm vazios
+SHEET_INT_COLUMNS = {'Parametros': ['Numero'], 'Passos': ['Index'], 'Interlocks': ['Bit'], 'Transicoes': ['Bit_Linha']}
+
+# 'auto' usa python-calamine se estiver instalado, senão openpyxl em modo streaming
+EXCEL_READER = 'auto'
+# Threads para ler os CSVs de uma pasta ou ZIP (uma folha por thread; o parser C do pandas liberta o GIL)
+MAX_WORKERS = min(len(MASTER_SHEETS), os.cpu_count() or 1)
+
+def _calamine_available():
+    try:
+        import python_calamine  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def _typed_frame(sheet_name, df):
+    """Vazios -> '' (como o fillna('') da mesclagem) e colunas-chave como int"""
+    for col in SHEET_INT_COLUMNS.get(sheet_name, []):
+        if col in df.columns:
+            as_num = pd.to_numeric(df[col], errors='coerce')
+            if not as_num.isna().any() and (as_num % 1 == 0).all():
+                df[col] = as_num.astype('int64')
+    return df.fillna('')
+
+def _sheet_frame_openpyxl(ws):
+    """Uma folha em streaming: cabeçalho na 1ª linha, linhas totalmente vazias ignoradas"""
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return pd.DataFrame()
+    keep = [i for i, h in enumerate(header) if h is not None]
+    columns = [str(header[i]) for i in keep]
+    records = [[row[i] if i < len(row) else None for i in keep] for row in rows if any(v is not None for v in row)]
+    return pd.DataFrame(records, columns=columns)
+
+def _read_excel(data):
+    """v105: Um único load_workbook (read_only) e uma passagem pelas folhas do Master"""
+    reader = EXCEL_READER
+    if reader == 'auto':
+        reader = 'calamine' if _calamine_available() else 'openpyxl'
+    if reader == 'calamine':
+        frames = pd.read_excel(io.BytesIO(data), sheet_name=None, engine='calamine')
+        return {name: df for name, df in frames.items() if name in MASTER_SHEETS}
+    import openpyxl
+    wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        return {ws.title: _sheet_frame_openpyxl(ws) for ws in wb.worksheets if ws.title in MASTER_SHEETS}
+    finally:
+        wb.close()
+
+def _read_csv(f):
+    return pd.read_csv(f, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+
+def _read_csv_dir(folder):
+    """Uma folha por ficheiro <Folha>.csv (UTF-8, com ou sem BOM)"""
+    names = [n for n in MASTER_SHEETS if os.path.exists(os.path.join(folder, f"{n}.csv"))]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        return dict(zip(names, pool.map(lambda name: _read_csv(os.path.join(folder, f"{name}.csv")), names)))
+
+def _csv_zip_members(data):
+    """{folha: membro} de um ZIP com <Folha>.csv (em qualquer subpasta); None se for um .xlsx ou não for ZIP"""
+    if not zipfile.is_zipfile(io.BytesIO(data)):
+        return None
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        names = zf.namelist()
+    if 'xl/workbook.xml' in names:
+        return None
+    by_file = {os.path.basename(n): n for n in names if not n.endswith('/')}
+    return {sheet: by_file[f"{sheet}.csv"] for sheet in MASTER_SHEETS if f"{sheet}.csv" in by_file}
+
+def _read_csv_zip(data, members):
+    """v105: Pasta de CSVs enviada como ZIP (upload pela interface); folhas lidas em paralelo como na pasta"""
+    def read_one(member):
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:  # um ZipFile por thread
+            return _read_csv(io.BytesIO(zf.read(member)))
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        return dict(zip(members, pool.map(read_one, members.values())))
+
+def read_master_sheets(source):
+    """Lê as folhas do Master (Excel ou pasta de CSVs) para DataFrames tipados.
+
+    `source` pode ser um caminho .xlsx, uma pasta com <Folha>.csv, bytes ou um
+    objeto file-like (ex.: FileStorage do Flask); v105: o ficheiro também pode ser
+    um ZIP com os <Folha>.csv. Só as folhas presentes em MASTER_SHEETS são
+    devolvidas, já com vazios como ''.
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        frames = _read_csv_dir(source)
+    else:
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                data = f.read()
+        elif isinstance(source, (bytes, bytearray)):
+            data = bytes(source)
+        else:
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            data = source.read()
+        members = _csv_zip_members(data)
+        frames = _read_csv_zip(data, members) if members else _read_excel(data)
+    logger.info(f"Folhas lidas: { {name: len(df) for name, df in frames.items()} }")
+    return {name: _typed_frame(name, df) for name, df in frames.items()}
@@ -0,0 +1,148 @@
+# Versão: v105 (Pacote binário de projeto)
+# Formato de troca entre sites: ZIP com uma tabela por ficheiro em colunas
+# (JSON compacto, deflate) + manifest.json com versão de schema e checksums.
+# v105: O CLI também importa o Master de uma pasta de CSVs (import-master).
+import os
+import io
+import sys
+import json
+import time
+import zipfile
+import hashlib
+import argparse
+from datetime import datetime
+from sqlalchemy import select
+
+BUNDLE_FORMAT = 'neat-project-bundle'
+BUNDLE_FORMAT_VERSION = 1
+BUNDLE_EXTENSION = '.neatpkg'
+INSERT_BATCH_SIZE = 5000
+
+def write_bundle(connection, metadata, out, schema_version, project_name=None):
+    """Escreve todas as tabelas de `metadata` num pacote (caminho ou file-like). Retorna o manifest."""
+    tables_meta = {}
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        for table in metadata.sorted_tables:
+            columns = [c.name for c in table.columns]
+            rows = connection.execute(select(table).order_by(*table.primary_key.columns)).fetchall()
+            column_arrays = [list(col) for col in zip(*rows)] if rows else [[] for _ in columns]
+            payload = json.dumps({'columns': columns, 'data': column_arrays}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            file_name = f"tables/{table.name}.json"
+            zf.writestr(file_name, payload)
+            tables_meta[table.name] = {'file': file_name, 'rows': len(rows), 'columns': columns, 'sha256': hashlib.sha256(payload).hexdigest()}
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'format_version': BUNDLE_FORMAT_VERSION,
+            'schema_version': schema_version,
+            'project': project_name,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'tables': tables_meta,
+        }
+        zf.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=2))
+    return manifest
+
+def read_bundle(source, max_schema_version, required_tables=()):
+    """Lê e valida um pacote. Retorna (manifest, {tabela: (colunas, arrays_de_colunas)}).
+
+    Levanta ValueError se o formato, a versão de schema, os checksums, as
+    colunas ou as contagens de linhas não baterem certo, ou se faltar alguma
+    das `required_tables` (v105: uma tabela em falta ficaria vazia no projeto).
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        source = io.BytesIO(source.read())
+    try:
+        zf = zipfile.ZipFile(source)
+    except zipfile.BadZipFile:
+        raise ValueError("Ficheiro não é um pacote válido.")
+    with zf:
+        try:
+            manifest = json.loads(zf.read('manifest.json'))
+        except KeyError:
+            raise ValueError("Pacote sem manifest.json.")
+        if manifest.get('format') != BUNDLE_FORMAT or manifest.get('format_version', 0) > BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"Formato de pacote não suportado: {manifest.get('format')} v{manifest.get('format_version')}")
+        if manifest.get('schema_version', 0) > max_schema_version:
+            raise ValueError(f"Pacote com schema v{manifest['schema_version']} mais recente que a aplicação (v{max_schema_version})")
+        missing = [name for name in required_tables if name not in manifest.get('tables', {})]
+        if missing:
+            raise ValueError(f"Pacote sem as tabelas: {', '.join(missing)}")
+        tables = {}
+        for name, meta in manifest['tables'].items():
+            payload = zf.read(meta['file'])
+            if hashlib.sha256(payload).hexdigest() != meta['sha256']:
+                raise ValueError(f"Checksum inválido na tabela {name}")
+            content = json.loads(payload)
+            if content['columns'] != meta['columns'] or len(content['data']) != len(content['columns']):
+                raise ValueError(f"Colunas inválidas na tabela {name}")
+            if any(len(col) != meta['rows'] for col in content['data']):
+                raise ValueError(f"Contagem de linhas inválida na tabela {name}")
+            tables[name] = (content['columns'], content['data'])
+    return manifest, tables
+
+def load_bundle_tables(connection, metadata, tables):
+    """Insere as tabelas lidas por read_bundle (pais antes de filhos), em lotes via executemany"""
+    for table in metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        columns, column_arrays = tables[table.name]
+        known = {c.name for c in table.columns}
+        keep = [i for i, c in enumerate(columns) if c in known]
+        if not keep or not column_arrays[keep[0]]:
+            continue
+        col_sql = ", ".join(f'"{columns[i]}"' for i in keep)
+        sql = f'INSERT INTO "{table.name}" ({col_sql}) VALUES ({", ".join("?" for _ in keep)})'
+        rows = list(zip(*(column_arrays[i] for i in keep)))
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            connection.exec_driver_sql(sql, rows[start:start + INSERT_BATCH_SIZE])
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta/importa projetos NEAT em pacote binário (.neatpkg) e importa o Master (CSV/Excel)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_exp = sub.add_parser('export', help="Exporta um projeto de DATABASE_FOLDER para um pacote")
+    p_exp.add_argument('project', help="Nome do ficheiro do projeto (ex.: Projeto.db)")
+    p_exp.add_argument('output', nargs='?', help=f"Caminho do pacote (padrão: <projeto>{BUNDLE_EXTENSION})")
+    p_imp = sub.add_parser('import', help="Substitui (ou cria) um projeto a partir de um pacote")
+    p_imp.add_argument('bundle', help="Caminho do pacote")
+    p_imp.add_argument('project', help="Nome do ficheiro do projeto de destino (ex.: Projeto.db)")
+    # v105: Master a partir de uma pasta de CSVs (ou .xlsx / .zip), sem passar pela interface
+    p_mst = sub.add_parser('import-master', help="Importa o Master de uma pasta com <Folha>.csv, de um .zip com esses CSVs ou de um .xlsx")
+    p_mst.add_argument('source', help="Pasta de CSVs, .zip ou .xlsx")
+    p_mst.add_argument('project', help="Nome do ficheiro do projeto de destino (ex.: Projeto.db)")
+    p_mst.add_argument('--mode', choices=('import', 'merge', 'upsert'), default='import',
+                       help="import = substituir (padrão), merge = só adicionar, upsert = adicionar e atualizar")
+    args = parser.parse_args(argv)
+
+    import app  # import tardio: o CLI reutiliza modelos, engines e a substituição atómica da aplicação
+    started = time.perf_counter()
+    if args.command == 'export':
+        output = args.output or f"{os.path.splitext(args.project)[0]}{BUNDLE_EXTENSION}"
+        with app.get_engine(args.project).connect() as conn:
+            manifest = write_bundle(conn, app.Base.metadata, output, app.SCHEMA_VERSION, args.project)
+        summary = {name: meta['rows'] for name, meta in manifest['tables'].items()}
+        print(f"Pacote escrito em {output} ({os.path.getsize(output)} bytes): {summary}")
+    elif args.command == 'import':
+        db_path = os.path.join(app.DATABASE_FOLDER, args.project)
+        if not os.path.exists(db_path):
+            app.create_project_db(db_path)
+        with open(args.bundle, 'rb') as f:
+            counts = app.import_project_bundle(args.project, f)
+        print(f"Projeto {args.project} substituído: {counts}")
+    else:
+        from master_ingest import read_master_sheets
+        db_path = os.path.join(app.DATABASE_FOLDER, args.project)
+        if not os.path.exists(db_path):
+            app.create_project_db(db_path)
+        if args.mode == 'import':
+            print(f"Projeto {args.project} substituído: {app.import_master_excel_atomic(args.project, args.source)}")
+        else:
+            with app.get_db_session(args.project) as dbsession:
+                summary = app.merge_master_sheets(args.project, dbsession, read_master_sheets(args.source), update=args.mode == 'upsert')
+            print(f"Projeto {args.project} mesclado" + (f": {app.format_upsert_summary(summary)}" if summary else ''))
+    print(f"Concluído em {time.perf_counter() - started:.2f}s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# Versão: v105 (Snapshots e clonagem de projetos)
+# Cópias consistentes de um projeto em uso com a API de backup online do SQLite
+# (sqlite3.Connection.backup), em passos de poucas páginas: cada passo só segura
+# um lock partilhado, por isso os leitores nunca esperam e as escritas entram
+# entre passos (se uma escrita de outra conexão alterar a base, o SQLite recomeça
+# a cópia). Os snapshots ficam comprimidos (.db.gz), uma pasta por projeto.
+import os
+import re
+import gzip
+import time
+import shutil
+import sqlite3
+import logging
+import pathlib
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_EXTENSION = '.db.gz'
+# Páginas copiadas por passo do backup (com páginas de 4 KiB, ~1 MiB por passo)
+BACKUP_PAGES_PER_STEP = 256
+# Segundos de espera quando um passo encontra a base ocupada (SQLITE_BUSY/LOCKED)
+BACKUP_BUSY_SLEEP = 0.05
+
+def backup_database(src_path, dest_path, pages=BACKUP_PAGES_PER_STEP):
+    """Copia `src_path` para `dest_path` com a API de backup (ficheiro temporário + os.replace). Retorna nº de passos"""
+    tmp_path = f"{dest_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    steps = 0
+    def progress(status, remaining, total):
+        nonlocal steps
+        steps += 1
+    src = sqlite3.connect(f"{pathlib.Path(src_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=BACKUP_BUSY_SLEEP)
+        finally:
+            dst.close()
+        os.replace(tmp_path, dest_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        src.close()
+    return steps
+
+def copy_database_into(src_path, dest_connection):
+    """Escreve `src_path` por cima da base aberta em `dest_connection` (sem transação aberta), num só passo.
+
+    v105: Em WAL o ficheiro do projeto não pode ser trocado (o -wal do antigo seria
+    aplicado ao novo); o backup para a própria base é uma transação: quem lê vê o
+    estado antigo até ao fim e depois o novo, neste e nos outros processos.
+    `src_path` é uma cópia descartável (base sombra).
+    """
+    src = sqlite3.connect(src_path)
+    src.execute('PRAGMA journal_mode=DELETE')  # cópias de projetos em WAL: sem isto a leitura read-only deixava -wal/-shm
+    src.close()
+    src = sqlite3.connect(f"{pathlib.Path(src_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        src.backup(dest_connection)
+    finally:
+        src.close()
+
+def _label_slug(label):
+    return re.sub(r'[^\w-]+', '-', (label or '').strip())[:40].strip('-_')
+
+def create_snapshot(db_path, snapshot_dir, label=None, keep=None, max_age_days=None):
+    """Backup em passos + gzip para <snapshot_dir>/<AAAAMMDD_HHMMSS>[_<label>].db.gz; aplica a retenção.
+
+    Retorna {'name', 'bytes', 'db_bytes', 'seconds'}.
+    """
+    started = time.perf_counter()
+    os.makedirs(snapshot_dir, exist_ok=True)
+    slug = _label_slug(label)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    name = f"{stamp}{'_' + slug if slug else ''}{SNAPSHOT_EXTENSION}"
+    for n in range(2, 100):  # dois snapshots no mesmo segundo não se sobrepõem
+        if not os.path.exists(os.path.join(snapshot_dir, name)):
+            break
+        name = f"{stamp}_{slug or 'snapshot'}-{n}{SNAPSHOT_EXTENSION}"
+    path = os.path.join(snapshot_dir, name)
+    raw_path = os.path.join(snapshot_dir, f".{name}.db")
+    try:
+        backup_database(db_path, raw_path)
+        db_bytes = os.path.getsize(raw_path)
+        with open(raw_path, 'rb') as f_in, gzip.open(f"{path}.tmp", 'wb', compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.replace(f"{path}.tmp", path)
+    finally:
+        for leftover in (raw_path, f"{path}.tmp"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    removed = prune_snapshots(snapshot_dir, keep, max_age_days)
+    info = {'name': name, 'bytes': os.path.getsize(path), 'db_bytes': db_bytes, 'seconds': round(time.perf_counter() - started, 3)}
+    logger.info(f"Snapshot {name} criado em {snapshot_dir}: {info}" + (f"; removidos {removed}" if removed else ''))
+    return info
+
+def list_snapshots(snapshot_dir):
+    """Snapshots de uma pasta, mais recentes primeiro: [{'name', 'label', 'created', 'bytes'}]"""
+    if not os.path.isdir(snapshot_dir):
+        return []
+    snapshots = []
+    for entry in os.scandir(snapshot_dir):
+        if not entry.is_file() or entry.name.startswith('.') or not entry.name.endswith(SNAPSHOT_EXTENSION):
+            continue
+        stem = entry.name[:-len(SNAPSHOT_EXTENSION)]
+        stat = entry.stat()
+        snapshots.append({'name': entry.name, 'label': stem[16:], 'created': datetime.fromtimestamp(stat.st_mtime), 'bytes': stat.st_size})
+    return sorted(snapshots, key=lambda s: (s['created'], s['name']), reverse=True)
+
+def prune_snapshots(snapshot_dir, keep=None, max_age_days=None):
+    """Mantém os `keep` mais recentes e apaga os mais velhos que `max_age_days` (o mais recente fica sempre)"""
+    snapshots = list_snapshots(snapshot_dir)
+    cutoff = datetime.now().timestamp() - max_age_days * 86400 if max_age_days else None
+    removed = []
+    for i, snap in enumerate(snapshots):
+        if i == 0:
+            continue
+        if (keep is not None and i >= keep) or (cutoff is not None and snap['created'].timestamp() < cutoff):
+            os.remove(os.path.join(snapshot_dir, snap['name']))
+            removed.append(snap['name'])
+    return removed
+
+def extract_snapshot(snapshot_path, dest_path):
+    """Descomprime um snapshot para `dest_path` (a validação fica para quem o vai usar)"""
+    with gzip.open(snapshot_path, 'rb') as f_in, open(dest_path, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+    return dest_path
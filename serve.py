@@ -0,0 +1,92 @@
+# Versão: v105 (Servidor de produção multi-processo com warm-up)
+# Substitui o `app.run(debug=True)` em produção: Waitress (WSGI puro Python)
+# com N threads por processo e, onde existe fork (Linux), N processos a
+# partilhar o mesmo socket. No Windows corre num único processo com threads.
+import os
+import sys
+import time
+import socket
+import signal
+import logging
+import argparse
+
+logger = logging.getLogger('serve')
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description="Servidor de produção do NEAT Gestor (Waitress)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1, help="Processos (só em sistemas com fork)")
+    parser.add_argument('--threads', type=int, default=8, help="Threads por processo")
+    parser.add_argument('--warm', nargs='*', default=None, metavar='PROJETO', help="Projetos a pré-aquecer (padrão: todos; sem valores: nenhum)")
+    return parser.parse_args(argv)
+
+def _serve_socket(app, sock, threads):
+    from waitress import serve
+    serve(app, sockets=[sock], threads=threads, ident='NEAT Gestor')
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(0)
+
+def main(argv=None):
+    args = _parse_args(argv)
+    try:
+        import waitress  # noqa: F401
+    except ImportError:
+        print("Waitress não instalado: pip install waitress", file=sys.stderr)
+        return 1
+    import app as neat_app
+    from logging_pipeline import stop_logging, use_worker_log_file
+
+    started = time.perf_counter()
+    # Migrações/schema correm uma vez no pai, antes do fork (evita corridas entre workers)
+    neat_app.warm_up(args.warm)
+    logger.info(f"Warm-up em {time.perf_counter() - started:.2f}s")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(1024)
+
+    workers = args.workers
+    if workers > 1 and not hasattr(os, 'fork'):
+        logger.warning("Sem fork nesta plataforma: a usar 1 processo com %d threads", args.threads)
+        workers = 1
+    logger.info(f"A servir em http://{args.host}:{args.port} ({workers} processos x {args.threads} threads)")
+
+    if workers == 1:
+        _serve_socket(neat_app.app, sock, args.threads)
+        return 0
+
+    children = []
+    for index in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # Filho: engines/Translator já foram reiniciados pelos hooks register_at_fork.
+            # v105: Substituições do ficheiro feitas por outro worker são detetadas pelo inode em get_engine/get_writer
+            # v105: SIGTERM termina o serve() com SystemExit (em vez de matar o processo) para o finally esvaziar o log
+            signal.signal(signal.SIGTERM, _exit_on_sigterm)
+            # v105: Ficheiro de log por índice (neat_gestor.w<N>.log): cada reinício reutiliza os mesmos
+            use_worker_log_file(index)
+            try:
+                neat_app.warm_up(args.warm)
+                _serve_socket(neat_app.app, sock, args.threads)
+            finally:
+                # v105: os._exit não corre o atexit; sem isto as linhas ainda na fila perdiam-se
+                stop_logging()
+                os._exit(0)
+        children.append(pid)
+
+    def _stop(signum, frame):
+        for child in children:
+            try: os.kill(child, signal.SIGTERM)
+            except ProcessLookupError: pass
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    for child in children:
+        try: os.waitpid(child, 0)
+        except ChildProcessError: pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+# Versão: v105 (Teste de stress das gravações concorrentes)
+# Várias threads gravam em paralelo no mesmo projeto pelo cliente de testes do
+# Flask (as mesmas rotas da interface) enquanto outras fazem GETs das páginas.
+# Trabalha numa cópia do projeto, ex.:
+#   python stress_writes.py --project Projeto.db --threads 16 --ops 25 --readers 8
+# Falha (código 1) se alguma gravação ou leitura der erro ou se uma gravação de
+# interlocks aparecer misturada com outra (as 32 linhas têm de vir da mesma gravação).
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import Counter
+
+def _flashes(client):
+    with client.session_transaction() as sess:
+        return sess.pop('_flashes', [])
+
+def _interlock_form(token):
+    form = {'target_tab': 'tab-interlocks', 'form_salvar_interlocks': '1'}
+    for bit in range(32):
+        for kind in ('seguranca', 'processo'):
+            for lang in ('pt', 'en', 'es'):
+                form[f'{kind}_{lang}_{bit}'] = f"{token} {kind} {lang} {bit}"
+    return form
+
+def _steps_form(token):
+    form = {'target_tab': 'tab-passos', 'form_salvar_passos': '1', 'grelha_start': '0', 'grelha_end': '10'}
+    for i in range(10):
+        form[f'codigo_passo_{i}'] = f"S{i}"
+        for lang in ('pt', 'en', 'es'):
+            form[f'descricao_{lang}_{i}'] = f"{token} passo {i} {lang}"
+    return form
+
+def _worker(app_module, project, thread_id, ops, shared_phase, own_phase, results, lock):
+    client = app_module.app.test_client()
+    local = Counter(); latencies = []; tokens = []
+    for i in range(ops):
+        kind = ('area', 'interlocks', 'passos')[i % 3]
+        token = f"t{thread_id}-{i}"
+        if kind == 'area':
+            url, form = f'/project/{project}/add_area', {'nome_area': f"STRESS_{token}"}
+        elif kind == 'interlocks':
+            url, form = f'/project/{project}/phase/{shared_phase}/', _interlock_form(token)
+            tokens.append(token)
+        else:
+            url, form = f'/project/{project}/phase/{own_phase}/', _steps_form(token)
+        started = time.perf_counter()
+        resp = client.post(url, data=form)
+        latencies.append(time.perf_counter() - started)
+        errors = [msg for category, msg in _flashes(client) if category == 'error']
+        local[f"{kind}:{'erro' if errors or resp.status_code != 302 else 'ok'}"] += 1
+        if errors:
+            local[f"msg:{errors[0][:80]}"] += 1
+    with lock:
+        results['status'].update(local)
+        results['latencies'].extend(latencies)
+        results['tokens'].extend(tokens)
+
+def _reader(app_module, project, phase_ids, stop, results, lock):
+    """v105: GETs contínuos (página do projeto, detalhe e data.json das phases) enquanto as gravações correm"""
+    client = app_module.app.test_client()
+    local = Counter(); latencies = []
+    urls = [f'/project/{project}/'] + [url for pid in phase_ids for url in (f'/project/{project}/phase/{pid}/', f'/project/{project}/phase/{pid}/data.json')]
+    i = 0
+    while not stop.is_set():
+        url = urls[i % len(urls)]; i += 1
+        started = time.perf_counter(); resp = None
+        try:
+            resp = client.get(url)
+            ok = resp.status_code == 200 and not [msg for category, msg in _flashes(client) if category == 'error']
+        except Exception as e:
+            ok = False
+            local[f"msg:{type(e).__name__}: {str(e)[:80]}"] += 1
+        latencies.append(time.perf_counter() - started)
+        local[f"leitura:{'ok' if ok else 'erro'}"] += 1
+        if not ok and resp is not None:
+            local[f"msg:GET {url.split('/', 3)[-1]} -> {resp.status_code}"] += 1
+    with lock:
+        results['status'].update(local)
+        results['read_latencies'].extend(latencies)
+
+def _check(app_module, project, shared_phase, own_phases, threads, ops, tokens):
+    problems = []
+    with app_module.get_db_session(project) as ds:
+        areas = ds.query(app_module.Areas).filter(app_module.Areas.nome_area.like('STRESS_%')).count()
+        expected_areas = threads * len(range(0, ops, 3))
+        if areas != expected_areas:
+            problems.append(f"áreas: {areas} != {expected_areas}")
+        texts = {il.seguranca_pt.split(' ')[0] for il in ds.query(app_module.Interlocks).filter_by(phase_id=shared_phase)}
+        if len(texts) != 1 or not texts <= set(tokens):
+            problems.append(f"interlocks da phase {shared_phase} misturados: {sorted(texts)[:5]}")
+        for phase_id in own_phases:
+            steps = {p.descricao_pt.split(' ')[0] for p in ds.query(app_module.Passos).filter(app_module.Passos.phase_id == phase_id, app_module.Passos.numero_passo < 10)}
+            if len(steps) != 1:
+                problems.append(f"passos da phase {phase_id} misturados: {sorted(steps)[:5]}")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress de gravações concorrentes num projeto (cliente de testes Flask)")
+    parser.add_argument('--project', help="Projeto a copiar (padrão: o primeiro de DATABASE_FOLDER)")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=24, help="Gravações por thread (áreas, interlocks e passos alternados)")
+    parser.add_argument('--readers', type=int, default=8, help="Threads a fazer GETs durante as gravações")
+    args = parser.parse_args(argv)
+
+    import app as app_module
+    project = args.project or app_module.list_projects()[0]
+    work_dir = tempfile.mkdtemp(prefix='neat_stress_')
+    try:
+        # v105: Cópia com a API de backup (o projeto pode estar em WAL, com páginas ainda no -wal)
+        app_module.backup_database(os.path.join(app_module.DATABASE_FOLDER, project), os.path.join(work_dir, project))
+        app_module.DATABASE_FOLDER = work_dir
+        with app_module.get_db_session(project) as ds:
+            phase_ids = [p.phase_id for p in ds.query(app_module.Phases).order_by(app_module.Phases.phase_id).limit(args.threads + 1)]
+        if len(phase_ids) < 2:
+            print("O projeto precisa de pelo menos 2 phases.", file=sys.stderr)
+            return 1
+        shared_phase = phase_ids[0]
+        own_phases = [phase_ids[1 + t % (len(phase_ids) - 1)] for t in range(args.threads)]
+
+        results = {'status': Counter(), 'latencies': [], 'tokens': [], 'read_latencies': []}
+        lock = threading.Lock()
+        stop = threading.Event()
+        threads = [threading.Thread(target=_worker, args=(app_module, project, t, args.ops, shared_phase, own_phases[t], results, lock)) for t in range(args.threads)]
+        readers = [threading.Thread(target=_reader, args=(app_module, project, phase_ids, stop, results, lock)) for _ in range(args.readers)]
+        started = time.perf_counter()
+        for t in readers + threads: t.start()
+        for t in threads: t.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for t in readers: t.join()
+
+        lat = sorted(results['latencies']) or [0]
+        total = len(results['latencies'])
+        writer = app_module.get_writer(project)
+        print(f"{total} gravações em {elapsed:.2f}s: {total / elapsed:.1f}/s, p50 {lat[len(lat) // 2] * 1000:.1f} ms, p95 {lat[max(int(len(lat) * 0.95) - 1, 0)] * 1000:.1f} ms")
+        reads = sorted(results['read_latencies']) or [0]
+        print(f"{len(results['read_latencies'])} leituras em paralelo: p50 {reads[len(reads) // 2] * 1000:.1f} ms, p95 {reads[max(int(len(reads) * 0.95) - 1, 0)] * 1000:.1f} ms")
+        print(f"escritor: {writer.stats['jobs']} escritas em {writer.stats['batches']} transações, {writer.stats['failed']} falhadas")
+        print(f"resultados: {dict(results['status'])}")
+        problems = _check(app_module, project, shared_phase, set(own_phases), args.threads, args.ops, results['tokens'])
+        errors = sum(n for k, n in results['status'].items() if k.endswith(':erro'))
+        for problem in problems:
+            print(f"FALHA: {problem}")
+        print("OK" if not problems and not errors else "FALHOU")
+        return 0 if not problems and not errors else 1
+    finally:
+        app_module.close_writer(project)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
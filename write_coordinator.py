@@ -0,0 +1,174 @@
+# Versão: v105 (Escritor único por projeto)
+# O SQLite admite um só escritor por ficheiro. Em vez de cada pedido abrir a
+# sua própria transação de escrita (e disputar o lock, com SQLITE_BUSY), as
+# escritas de um projeto entram numa fila limitada e são executadas por uma
+# única thread; as que chegam juntas partilham uma transação (um SAVEPOINT
+# por escrita, para que uma falha não desfaça as outras).
+import queue
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Escritas pendentes por projeto; acima disto o pedido falha em vez de acumular
+WRITE_QUEUE_SIZE = 256
+# Escritas pequenas agrupadas numa única transação (um fsync por lote)
+WRITE_BATCH_MAX = 32
+# Segundos à espera de lugar na fila / de a escrita começar (v105: uma escrita já
+# iniciada é sempre esperada até ao fim, porque vai fazer COMMIT de qualquer forma)
+WRITE_SUBMIT_TIMEOUT = 5
+WRITE_RESULT_TIMEOUT = 60
+
+class WriteQueueFull(Exception):
+    pass
+
+class WriteTimeout(TimeoutError):
+    pass
+
+class WriterClosed(Exception):
+    """O escritor já foi fechado (ex.: ficheiro do projeto substituído); pedir um novo"""
+
+class _WriteJob:
+    __slots__ = ('fn', 'exclusive', 'future')
+
+    def __init__(self, fn, exclusive):
+        self.fn = fn
+        self.exclusive = exclusive
+        self.future = Future()
+
+_STOP = object()
+
+class ProjectWriter:
+    """Thread escritora de um projeto. `engine_factory()` é chamado na própria thread, uma vez.
+
+    `run(fn)` executa `fn(session)` na thread escritora e devolve o seu
+    resultado depois do COMMIT. Escritas `exclusive` (ex.: mesclagens) correm
+    sozinhas e podem fazer commit/rollback por conta própria; as restantes não
+    devem chamar commit. Os objetos ORM devolvidos ficam desligados da sessão:
+    devolver valores simples.
+    """
+
+    def __init__(self, name, engine_factory, max_queue=WRITE_QUEUE_SIZE, max_batch=WRITE_BATCH_MAX):
+        self.name = name
+        self.max_batch = max_batch
+        self._engine_factory = engine_factory
+        self._engine = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._held = None  # trabalho exclusivo (ou paragem) retirado da fila ao montar o lote anterior
+        self._closed = False
+        self._submit_lock = threading.Lock()  # nenhuma escrita entra na fila depois da paragem
+        self.stats = {'jobs': 0, 'batches': 0, 'failed': 0}
+        self._thread = threading.Thread(target=self._loop, name=f"writer-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, exclusive=False, submit_timeout=WRITE_SUBMIT_TIMEOUT):
+        job = _WriteJob(fn, exclusive)
+        with self._submit_lock:
+            if self._closed:
+                raise WriterClosed(f"Escritor do projeto {self.name} fechado.")
+            try:
+                self._queue.put(job, timeout=submit_timeout)
+            except queue.Full:
+                raise WriteQueueFull(f"Fila de escrita do projeto {self.name} cheia ({self._queue.maxsize} pendentes); tente novamente.")
+        return job.future
+
+    def run(self, fn, exclusive=False, timeout=WRITE_RESULT_TIMEOUT, submit_timeout=WRITE_SUBMIT_TIMEOUT):
+        future = self.submit(fn, exclusive, submit_timeout)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            if future.cancel():  # ainda na fila: não chega a ser executada
+                raise WriteTimeout(f"Escrita no projeto {self.name} não iniciada em {timeout}s.")
+            # v105: Já em curso: um erro aqui seria falso (a escrita termina com COMMIT); espera-se pelo resultado
+            logger.warning(f"Escrita no projeto {self.name} ainda em curso após {timeout}s; a aguardar o fim")
+            return future.result()
+
+    def close(self, timeout=None):
+        """Executa o que já está na fila, para a thread e liberta a engine"""
+        with self._submit_lock:
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        job = self._held if self._held is not None else self._queue.get()
+        self._held = None
+        if job is _STOP or job.exclusive:
+            return job, [job]
+        batch = [job]
+        while len(batch) < self.max_batch:
+            try:
+                nxt = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is _STOP or nxt.exclusive:
+                self._held = nxt
+                break
+            batch.append(nxt)
+        return job, batch
+
+    def _loop(self):
+        try:
+            while True:
+                first, batch = self._next_batch()
+                if first is _STOP:
+                    break
+                jobs = [job for job in batch if job.future.set_running_or_notify_cancel()]
+                if not jobs:
+                    continue
+                try:
+                    if self._engine is None:
+                        self._engine = self._engine_factory()
+                    if first.exclusive:
+                        self._run_exclusive(first)
+                    else:
+                        self._run_batch(jobs)
+                except Exception as e:  # ex.: engine indisponível
+                    for job in jobs:
+                        if not job.future.done():
+                            job.future.set_exception(e)
+        finally:
+            if self._engine is not None:
+                self._engine.dispose()
+
+    def _run_exclusive(self, job):
+        with Session(self._engine) as session:
+            try:
+                result = job.fn(session)
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                self.stats['failed'] += 1
+                job.future.set_exception(e)
+                return
+        self.stats['jobs'] += 1; self.stats['batches'] += 1
+        job.future.set_result(result)
+
+    def _run_batch(self, jobs):
+        done = []
+        with Session(self._engine) as session:
+            for job in jobs:
+                try:
+                    with session.begin_nested():
+                        result = job.fn(session)
+                        session.flush()
+                    done.append((job, result))
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    job.future.set_exception(e)
+                session.expire_all()  # a escrita seguinte relê o estado (coleções carregadas aqui ficariam desatualizadas)
+            try:
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Commit do lote de escrita falhou em {self.name}: {e}")
+                for job, _ in done:
+                    job.future.set_exception(e)
+                return
+        self.stats['jobs'] += len(done); self.stats['batches'] += 1
+        if len(jobs) > 1:
+            logger.debug(f"Lote de {len(jobs)} escritas confirmado em {self.name}")
+        for job, result in done:
+            job.future.set_result(result)